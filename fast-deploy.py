@@ -1,3 +1,4 @@
+import os
 import subprocess
 import time
 from ruamel.yaml import YAML
@@ -153,12 +154,28 @@ def install_helm_chart():
         print("Failed to install Helm chart. Exiting.")
         return
 
+def run_benchmark():
+    # Run the in-process benchmark and compare it with the saved baseline, if any
+    results_dir = "source_code/benchmark/results"
+    baseline = f"{results_dir}/baseline.json"
+    candidate = f"{results_dir}/candidate.json"
+    if run_command("cd source_code/benchmark && python run_benchmark.py run --in-process --keys zipf --output results/candidate.json") is None:
+        print("Benchmark failed. Exiting.")
+        return
+    if not os.path.exists(baseline):
+        os.replace(candidate, baseline)
+        print(f"No baseline found; saved this run as {baseline}")
+        return
+    if run_command(f"python source_code/benchmark/run_benchmark.py compare {baseline} {candidate} --max-regression 10") is None:
+        print("Performance regressed against the baseline.")
+
 def main():
     print("Select an option:")
     print("1. Cleanup existing version of test-app")
     print("2. Commit and push current changes to Git")
     print("3. Update image tag and version number")
     print("4. Install Helm chart")
+    print("5. Run benchmark and compare with baseline")
     option = int(input("Enter option number: "))
 
     if option == 1:
@@ -169,6 +186,8 @@ def main():
         update_image_tag_and_version()
     elif option == 4:
         install_helm_chart()
+    elif option == 5:
+        run_benchmark()
     else:
         print("Invalid option selected")
 
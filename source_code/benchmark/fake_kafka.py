@@ -0,0 +1,310 @@
+"""In-memory stand-in for the parts of kafka-python the services use.
+
+install() registers this module as ``kafka`` (plus ``kafka.admin``,
+``kafka.errors`` and the ``kafka.record.abc`` the OpenTelemetry Kafka
+instrumentation imports) so app.py and data_processor.py run unchanged against a
+single process-wide broker. Records are stored per partition, consumer
+groups keep committed offsets, and produce acks complete immediately.
+"""
+import sys
+import threading
+import time
+import types
+import zlib
+from collections import namedtuple
+
+TopicPartition = namedtuple('TopicPartition', ['topic', 'partition'])
+ConsumerRecord = namedtuple('ConsumerRecord', ['topic', 'partition', 'offset', 'timestamp', 'key', 'value', 'headers'])
+RecordMetadata = namedtuple('RecordMetadata', ['topic', 'partition', 'offset', 'timestamp'])
+
+
+class KafkaError(Exception):
+    pass
+
+
+class KafkaTimeoutError(KafkaError):
+    pass
+
+
+class NoBrokersAvailable(KafkaError):
+    pass
+
+
+class TopicAlreadyExistsError(KafkaError):
+    pass
+
+
+class ABCRecord:
+    """Placeholder for kafka.record.abc.ABCRecord, only needed at import time."""
+
+
+class NewTopic:
+    def __init__(self, name, num_partitions, replication_factor, topic_configs=None, **kwargs):
+        self.name = name
+        self.num_partitions = num_partitions
+        self.replication_factor = replication_factor
+        self.topic_configs = topic_configs or {}
+
+
+class NewPartitions:
+    def __init__(self, total_count, new_assignments=None):
+        self.total_count = total_count
+
+
+class InMemoryBroker:
+    """Topics, partitions and committed offsets shared by every client in the process."""
+
+    def __init__(self, produce_latency_ms=0):
+        self.produce_latency = produce_latency_ms / 1000.0
+        self._topics = {}
+        self._committed = {}
+        self._condition = threading.Condition()
+
+    def create_topic(self, name, partitions=1):
+        with self._condition:
+            if name in self._topics:
+                raise TopicAlreadyExistsError(name)
+            self._topics[name] = [[] for _ in range(partitions)]
+
+    def grow_topic(self, name, total_count):
+        with self._condition:
+            partitions = self._topics[name]
+            partitions.extend([] for _ in range(total_count - len(partitions)))
+
+    def delete_topic(self, name):
+        with self._condition:
+            self._topics.pop(name, None)
+
+    def topic_names(self):
+        with self._condition:
+            return list(self._topics)
+
+    def partitions_for(self, topic):
+        with self._condition:
+            partitions = self._topics.get(topic)
+            return set(range(len(partitions))) if partitions is not None else None
+
+    def append(self, topic, partition, key, value, headers):
+        with self._condition:
+            # Like auto.create.topics.enable on a real broker
+            partitions = self._topics.setdefault(topic, [[]])
+            if partition is None:
+                partition = zlib.crc32(key) % len(partitions) if key is not None else 0
+            log = partitions[partition]
+            timestamp = int(time.time() * 1000)
+            log.append(ConsumerRecord(topic, partition, len(log), timestamp, key, value, headers or []))
+            self._condition.notify_all()
+            return RecordMetadata(topic, partition, len(log) - 1, timestamp)
+
+    def end_offset(self, tp):
+        with self._condition:
+            partitions = self._topics.get(tp.topic, [])
+            return len(partitions[tp.partition]) if tp.partition < len(partitions) else 0
+
+    def fetch(self, positions, max_records, timeout):
+        """Return up to max_records new records for the given positions, waiting up to timeout."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                batch, count = {}, 0
+                for tp, offset in positions.items():
+                    partitions = self._topics.get(tp.topic, [])
+                    if tp.partition >= len(partitions) or count >= max_records:
+                        continue
+                    records = partitions[tp.partition][offset:offset + max_records - count]
+                    if records:
+                        batch[tp] = records
+                        count += len(records)
+                remaining = deadline - time.monotonic()
+                if batch or remaining <= 0:
+                    return batch
+                self._condition.wait(remaining)
+
+    def commit(self, group_id, offsets):
+        with self._condition:
+            for tp, offset in offsets.items():
+                self._committed[(group_id, tp)] = offset
+
+    def committed(self, group_id, tp):
+        with self._condition:
+            return self._committed.get((group_id, tp))
+
+
+broker = InMemoryBroker()
+
+
+class FutureRecordMetadata:
+    """Already-completed produce future with kafka-python's callback interface."""
+
+    def __init__(self, value=None, exception=None):
+        self.value = value
+        self.exception = exception
+        self.is_done = True
+
+    def succeeded(self):
+        return self.exception is None
+
+    def failed(self):
+        return self.exception is not None
+
+    def add_callback(self, fn, *args, **kwargs):
+        if self.succeeded():
+            fn(*args, self.value, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        if self.failed():
+            fn(*args, self.exception, **kwargs)
+        return self
+
+    def get(self, timeout=None):
+        if self.failed():
+            raise self.exception
+        return self.value
+
+
+class KafkaProducer:
+    def __init__(self, bootstrap_servers=None, key_serializer=None, value_serializer=None, **config):
+        self.key_serializer = key_serializer
+        self.value_serializer = value_serializer
+        self.sent = 0
+
+    def send(self, topic, value=None, key=None, headers=None, partition=None, timestamp_ms=None):
+        if broker.produce_latency:
+            time.sleep(broker.produce_latency)
+        key_bytes = self.key_serializer(key) if key is not None and self.key_serializer else key
+        value_bytes = self.value_serializer(value) if self.value_serializer else value
+        try:
+            metadata = broker.append(topic, partition, key_bytes, value_bytes, headers)
+        except IndexError:
+            return FutureRecordMetadata(exception=KafkaError(f"Unknown partition {partition} of {topic}"))
+        self.sent += 1
+        return FutureRecordMetadata(value=metadata)
+
+    def flush(self, timeout=None):
+        pass
+
+    def metrics(self):
+        return {'producer-metrics': {'record-send-total': float(self.sent)}}
+
+    def close(self, timeout=None):
+        pass
+
+
+class KafkaConsumer:
+    def __init__(self, *topics, bootstrap_servers=None, group_id=None, auto_offset_reset='latest',
+                 enable_auto_commit=True, max_poll_records=500, **config):
+        self.group_id = group_id
+        self.auto_offset_reset = auto_offset_reset
+        self.enable_auto_commit = enable_auto_commit
+        self.max_poll_records = max_poll_records
+        self._subscription = list(topics)
+        self._positions = {}
+
+    def _refresh_subscription(self):
+        for topic in self._subscription:
+            for partition in broker.partitions_for(topic) or ():
+                tp = TopicPartition(topic, partition)
+                if tp not in self._positions:
+                    self._positions[tp] = self._initial_position(tp)
+
+    def _initial_position(self, tp):
+        committed = broker.committed(self.group_id, tp) if self.group_id else None
+        if committed is not None:
+            return committed
+        return 0 if self.auto_offset_reset == 'earliest' else broker.end_offset(tp)
+
+    def partitions_for_topic(self, topic):
+        return broker.partitions_for(topic)
+
+    def assign(self, partitions):
+        self._subscription = []
+        self._positions = {tp: self._initial_position(tp) for tp in partitions}
+
+    def assignment(self):
+        self._refresh_subscription()
+        return set(self._positions)
+
+    def seek(self, tp, offset):
+        self._positions[tp] = offset
+
+    def seek_to_end(self, *partitions):
+        for tp in partitions or list(self._positions):
+            self._positions[tp] = broker.end_offset(tp)
+
+    def position(self, tp):
+        return self._positions[tp]
+
+    def end_offsets(self, partitions):
+        return {tp: broker.end_offset(tp) for tp in partitions}
+
+    def poll(self, timeout_ms=0, max_records=None):
+        self._refresh_subscription()
+        batch = broker.fetch(dict(self._positions), max_records or self.max_poll_records, timeout_ms / 1000.0)
+        for tp, records in batch.items():
+            self._positions[tp] = records[-1].offset + 1
+        if batch and self.group_id and self.enable_auto_commit:
+            self.commit()
+        return batch
+
+    def commit(self, offsets=None):
+        broker.commit(self.group_id, offsets or dict(self._positions))
+
+    def close(self, autocommit=True):
+        pass
+
+
+class KafkaAdminClient:
+    def __init__(self, bootstrap_servers=None, **config):
+        pass
+
+    def list_topics(self):
+        return broker.topic_names()
+
+    def create_topics(self, new_topics, timeout_ms=None, validate_only=False):
+        for topic in new_topics:
+            broker.create_topic(topic.name, topic.num_partitions)
+
+    def describe_topics(self, topics=None):
+        descriptions = []
+        for topic in topics or broker.topic_names():
+            partitions = broker.partitions_for(topic) or set()
+            descriptions.append({'topic': topic, 'partitions': [{'partition': p} for p in sorted(partitions)]})
+        return descriptions
+
+    def create_partitions(self, topic_partitions, timeout_ms=None, validate_only=False):
+        for topic, new_partitions in topic_partitions.items():
+            broker.grow_topic(topic, new_partitions.total_count)
+
+    def delete_topics(self, topics, timeout_ms=None):
+        for topic in topics:
+            broker.delete_topic(topic)
+
+    def close(self):
+        pass
+
+
+def install(produce_latency_ms=0):
+    """Make ``import kafka`` (and its admin/errors/record submodules) resolve to this shim."""
+    broker.produce_latency = produce_latency_ms / 1000.0
+    package = types.ModuleType('kafka')
+    package.__path__ = []
+    admin = types.ModuleType('kafka.admin')
+    errors = types.ModuleType('kafka.errors')
+    record = types.ModuleType('kafka.record')
+    record.__path__ = []
+    record_abc = types.ModuleType('kafka.record.abc')
+    record_abc.ABCRecord = ABCRecord
+    record.abc = record_abc
+    for name in ('KafkaProducer', 'KafkaConsumer', 'KafkaAdminClient', 'TopicPartition'):
+        setattr(package, name, globals()[name])
+    for name in ('KafkaAdminClient', 'NewTopic', 'NewPartitions'):
+        setattr(admin, name, globals()[name])
+    for name in ('KafkaError', 'KafkaTimeoutError', 'NoBrokersAvailable', 'TopicAlreadyExistsError'):
+        setattr(errors, name, globals()[name])
+    package.admin, package.errors, package.record = admin, errors, record
+    sys.modules.update({
+        'kafka': package, 'kafka.admin': admin, 'kafka.errors': errors,
+        'kafka.record': record, 'kafka.record.abc': record_abc,
+    })
+    return broker
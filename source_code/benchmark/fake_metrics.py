@@ -0,0 +1,154 @@
+"""Fake source of the autoscaling metrics, for testing HPA settings locally.
+
+Serves /metrics with the series the HPA reads (kafka_consumer_lag,
+processor_records_per_second, http_requests_in_flight, http_requests_queued,
+kafka_replies_pending) following a load scenario, so prometheus-adapter and
+the HPAs can be exercised without generating real load. Each step also
+prints the replica counts the HPAs would ask for, using the HPA formula
+ceil(current * value / target) with the targets given on the command line.
+
+    # Lag climbs to 20000 over 5 minutes and falls back
+    python fake_metrics.py --scenario ramp --peak-lag 20000 --lag-target 1000 --port 9400
+
+    # Override a value while it runs
+    curl 'localhost:9400/set?lag=50000&in_flight=300'
+"""
+import argparse
+import math
+import threading
+import time
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from prometheus_client import CollectorRegistry, Gauge, make_wsgi_app
+
+SCENARIOS = ('steady', 'ramp', 'spike')
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def load_level(scenario, elapsed, period):
+    """Fraction of the peak load at elapsed seconds into the scenario."""
+    phase = (elapsed % period) / period
+    if scenario == 'steady':
+        return 1.0
+    if scenario == 'ramp':
+        # Up for the first half of each period, down for the second
+        return 1 - abs(2 * phase - 1)
+    # spike: quiet, then a burst for the last tenth of each period
+    return 1.0 if phase >= 0.9 else 0.05
+
+
+def desired_replicas(current, value, target, max_replicas):
+    if target <= 0:
+        return current
+    return max(1, min(max_replicas, math.ceil(current * value / target)))
+
+
+class FakeMetrics:
+    def __init__(self, args):
+        self.args = args
+        self.registry = CollectorRegistry()
+        self.lag = Gauge('kafka_consumer_lag', 'Fake consumer lag', ['topic', 'partition'], registry=self.registry)
+        self.rate = Gauge('processor_records_per_second', 'Fake processing rate', ['topic', 'partition'],
+                          registry=self.registry)
+        self.in_flight = Gauge('http_requests_in_flight', 'Fake in-flight requests', registry=self.registry)
+        self.queued = Gauge('http_requests_queued', 'Fake queued requests', registry=self.registry)
+        self.pending = Gauge('kafka_replies_pending', 'Fake pending replies', registry=self.registry)
+        self.overrides = {}
+        self.processors = args.processors
+        self.gateways = args.gateways
+        self._lock = threading.Lock()
+
+    def values(self, elapsed):
+        level = load_level(self.args.scenario, elapsed, self.args.period)
+        in_flight = self.args.peak_in_flight * level
+        values = {
+            'lag': self.args.peak_lag * level,
+            'in_flight': in_flight,
+            'queued': max(0.0, in_flight - self.args.max_concurrent),
+            'pending': in_flight * 0.8,
+        }
+        with self._lock:
+            values.update(self.overrides)
+        return values
+
+    def step(self, elapsed):
+        values = self.values(elapsed)
+        partitions = self.args.partitions
+        for partition in range(partitions):
+            labels = {'topic': 'data_requests', 'partition': str(partition)}
+            self.lag.labels(**labels).set(values['lag'] / partitions)
+            self.rate.labels(**labels).set(self.args.rate_per_replica * min(self.processors, partitions) / partitions)
+        # Per-pod gauges, as the average pod would report them
+        self.in_flight.set(values['in_flight'] / self.gateways)
+        self.queued.set(values['queued'] / self.gateways)
+        self.pending.set(values['pending'] / self.gateways)
+
+        # The External lag metric is a total; HPA divides it by the replica count
+        self.processors = desired_replicas(
+            self.processors, values['lag'] / self.processors, self.args.lag_target,
+            min(self.args.max_replicas, partitions))
+        self.gateways = desired_replicas(
+            self.gateways, values['in_flight'] / self.gateways, self.args.in_flight_target, self.args.max_replicas)
+        print(f"t={elapsed:6.0f}s lag={values['lag']:8.0f} in_flight={values['in_flight']:6.0f} "
+              f"-> data-processor {self.processors} replicas, api-gateway {self.gateways} replicas", flush=True)
+
+    def wsgi_app(self):
+        metrics_app = make_wsgi_app(self.registry)
+
+        def app(environ, start_response):
+            if environ.get('PATH_INFO') == '/set':
+                query = parse_qs(environ.get('QUERY_STRING', ''))
+                with self._lock:
+                    for name, value in query.items():
+                        self.overrides[name] = float(value[-1])
+                start_response('200 OK', [('Content-Type', 'text/plain')])
+                return [b'ok\n']
+            if environ.get('PATH_INFO') == '/reset':
+                with self._lock:
+                    self.overrides.clear()
+                start_response('200 OK', [('Content-Type', 'text/plain')])
+                return [b'ok\n']
+            return metrics_app(environ, start_response)
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=9400)
+    parser.add_argument('--scenario', choices=SCENARIOS, default='ramp')
+    parser.add_argument('--period', type=float, default=600, help='Seconds per scenario cycle')
+    parser.add_argument('--interval', type=float, default=15, help='Seconds between updates')
+    parser.add_argument('--partitions', type=int, default=6, help='Partitions of data_requests')
+    parser.add_argument('--peak-lag', type=float, default=20000)
+    parser.add_argument('--peak-in-flight', type=float, default=400)
+    parser.add_argument('--max-concurrent', type=float, default=200, help='Gateway concurrency limit')
+    parser.add_argument('--rate-per-replica', type=float, default=500, help='Records per second per processor')
+    parser.add_argument('--lag-target', type=float, default=1000, help='autoscaling.dataProcessor.targetLagPerReplica')
+    parser.add_argument('--in-flight-target', type=float, default=50,
+                        help='autoscaling.apiGateway.targetInFlightRequests')
+    parser.add_argument('--max-replicas', type=int, default=100)
+    parser.add_argument('--processors', type=int, default=1, help='Starting data processor replicas')
+    parser.add_argument('--gateways', type=int, default=1, help='Starting API gateway replicas')
+    args = parser.parse_args()
+
+    fake = FakeMetrics(args)
+    server = make_server('', args.port, fake.wsgi_app(), handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='fake-metrics', daemon=True).start()
+    print(f"Serving fake autoscaling metrics on :{args.port}/metrics", flush=True)
+    started = time.monotonic()
+    try:
+        while True:
+            fake.step(time.monotonic() - started)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
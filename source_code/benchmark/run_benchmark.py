@@ -0,0 +1,323 @@
+"""Load test for /myapi/{id}.
+
+Drives GET/PUT/PATCH/DELETE at a fixed concurrency with uniform or Zipfian
+keys and reports p50/p95/p99 latency and throughput per operation, saved as
+JSON so runs can be compared.
+
+    # Against in-process fakes (fakeredis, mongomock, in-memory Kafka)
+    python run_benchmark.py run --in-process --duration 30 --output results/candidate.json
+
+    # Against a running stack, e.g. docker compose up -d in this directory
+    python run_benchmark.py run --url http://localhost:8080 --keys zipf --output results/candidate.json
+
+    # Compare two runs; exits 1 when the candidate regressed beyond the threshold
+    python run_benchmark.py compare results/baseline.json results/candidate.json --max-regression 10
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+OPERATIONS = ('get', 'put', 'patch', 'delete')
+# Statuses that are a correct answer for the operation (a GET after a DELETE is a 404)
+EXPECTED_STATUSES = {'get': (200, 404), 'put': (200,), 'patch': (200, 404), 'delete': (204, 404)}
+
+
+class UniformKeys:
+    def __init__(self, key_count, rng):
+        self.key_count = key_count
+        self.rng = rng
+
+    def sample(self):
+        return self.rng.randint(1, self.key_count)
+
+
+class ZipfKeys:
+    """Zipfian keys: key k is drawn with probability proportional to 1 / k**exponent."""
+
+    def __init__(self, key_count, rng, exponent=1.1):
+        self.rng = rng
+        weights = [1.0 / k ** exponent for k in range(1, key_count + 1)]
+        total = sum(weights)
+        self._cdf = list(itertools.accumulate(weight / total for weight in weights))
+
+    def sample(self):
+        return min(bisect.bisect_left(self._cdf, self.rng.random()), len(self._cdf) - 1) + 1
+
+
+def parse_mix(value):
+    """Parse an operation mix like 'get=80,put=10,patch=5,delete=5' into weights."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().lower()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}; expected one of {OPERATIONS}")
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The operation mix needs at least one positive weight")
+    return mix
+
+
+def item_payload(key, rng):
+    return {'name': f'car-{key}', 'price': rng.randint(1000, 100000), 'year': str(rng.randint(1990, 2025))}
+
+
+async def send(client, operation, key, rng):
+    path = f'/myapi/{key}'
+    if operation == 'get':
+        return await client.get(path)
+    if operation == 'put':
+        return await client.put(path, json=item_payload(key, rng))
+    if operation == 'patch':
+        return await client.patch(path, json=item_payload(key, rng))
+    return await client.delete(path)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+        self.statuses = {}
+
+    def record(self, operation, latency, status):
+        self.latencies[operation].append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status not in EXPECTED_STATUSES[operation]:
+            self.errors[operation] += 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        'mean_ms': to_ms(sum(values) / len(values)) if values else None,
+        'p50_ms': to_ms(percentile(values, 0.50)),
+        'p95_ms': to_ms(percentile(values, 0.95)),
+        'p99_ms': to_ms(percentile(values, 0.99)),
+        'max_ms': to_ms(values[-1]) if values else None,
+    }
+
+
+async def worker(client, recorder, keys, operations, weights, deadline, rng, remaining):
+    while time.monotonic() < deadline and next(remaining, None) is not None:
+        operation = rng.choices(operations, weights)[0]
+        key = keys.sample()
+        started = time.perf_counter()
+        try:
+            response = await send(client, operation, key, rng)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        except Exception as e:
+            # In-process, an exception in the app reaches the client; count it rather than end the run
+            status = type(e).__name__
+        recorder.record(operation, time.perf_counter() - started, status)
+
+
+async def preload(client, key_count, concurrency, rng):
+    """PUT every key once so reads start from a populated store."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def put(key):
+        async with semaphore:
+            await client.put(f'/myapi/{key}', json=item_payload(key, rng))
+
+    await asyncio.gather(*(put(key) for key in range(1, key_count + 1)))
+
+
+async def run_load(client, args):
+    rng = random.Random(args.seed)
+    operations = [operation for operation in OPERATIONS if args.mix.get(operation)]
+    weights = [args.mix[operation] for operation in operations]
+    if args.keys == 'zipf':
+        keys = ZipfKeys(args.key_count, rng, args.zipf_exponent)
+    else:
+        keys = UniformKeys(args.key_count, rng)
+
+    if args.preload:
+        await preload(client, args.key_count, args.concurrency, rng)
+
+    async def phase(duration, requests=None):
+        recorder = Recorder()
+        # Shared across workers so --requests caps the total, not each worker
+        remaining = iter(range(requests)) if requests else itertools.repeat(True)
+        deadline = time.monotonic() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, recorder, keys, operations, weights, deadline, rng, remaining)
+            for _ in range(args.concurrency)
+        ))
+        return recorder, time.perf_counter() - started
+
+    if args.warmup > 0:
+        await phase(args.warmup)
+    return await phase(args.duration if not args.requests else float('inf'), args.requests)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(args, recorder, elapsed):
+    all_latencies = [latency for values in recorder.latencies.values() for latency in values]
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'target': 'in-process' if args.in_process else args.url,
+        'config': {
+            'concurrency': args.concurrency,
+            'duration_seconds': args.duration,
+            'requests': args.requests,
+            'warmup_seconds': args.warmup,
+            'key_distribution': args.keys,
+            'key_count': args.key_count,
+            'zipf_exponent': args.zipf_exponent if args.keys == 'zipf' else None,
+            'mix': args.mix,
+            'seed': args.seed,
+        },
+        'elapsed_seconds': round(elapsed, 3),
+        'overall': summarize(all_latencies, sum(recorder.errors.values()), elapsed),
+        'operations': {
+            operation: summarize(recorder.latencies[operation], recorder.errors[operation], elapsed)
+            for operation in OPERATIONS if recorder.latencies[operation]
+        },
+        'statuses': {str(status): count for status, count in sorted(recorder.statuses.items(), key=str)},
+    }
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    if args.in_process:
+        from in_process import InProcessStack
+        stack = InProcessStack(produce_latency_ms=args.produce_latency_ms)
+        transport = httpx.ASGITransport(app=stack.load())
+        await stack.start()
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=timeout) as client:
+                recorder, elapsed = await run_load(client, args)
+        finally:
+            await stack.stop()
+    else:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+            recorder, elapsed = await run_load(client, args)
+    return build_report(args, recorder, elapsed)
+
+
+def print_report(report):
+    print(f"{'operation':<10}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report['operations'].items()) + [('overall', report['overall'])]
+    for name, stats in rows:
+        print(f"{name:<10}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms']!s:>10}{stats['p95_ms']!s:>10}{stats['p99_ms']!s:>10}")
+
+
+def change(baseline, candidate):
+    if not baseline or candidate is None:
+        return None
+    return round((candidate - baseline) / baseline * 100, 1)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = []
+    print(f"{'operation':<10}{'metric':<16}{'baseline':>12}{'candidate':>12}{'change %':>10}")
+    for name in ['overall'] + [operation for operation in OPERATIONS if operation in baseline['operations']]:
+        before = baseline['overall'] if name == 'overall' else baseline['operations'][name]
+        after = candidate['overall'] if name == 'overall' else candidate['operations'].get(name)
+        if after is None:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            delta = change(before[metric], after[metric])
+            print(f"{name:<10}{metric:<16}{before[metric]!s:>12}{after[metric]!s:>12}{delta!s:>10}")
+            # Lower throughput or higher latency is worse
+            worse = -delta if metric == 'throughput_rps' and delta is not None else delta
+            if args.max_regression is not None and worse is not None and worse > args.max_regression:
+                regressions.append(f"{name} {metric} {delta:+}%")
+
+    if baseline.get('config') != candidate.get('config'):
+        print("Warning: the runs used different configurations", file=sys.stderr)
+    if regressions:
+        print(f"Regressions beyond {args.max_regression}%: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run a load test and save the results')
+    target = run_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of a running API gateway')
+    target.add_argument('--in-process', action='store_true', help='Run both services in-process against fakes')
+    run_parser.add_argument('--concurrency', type=int, default=32)
+    run_parser.add_argument('--duration', type=float, default=30, help='Measured seconds (ignored with --requests)')
+    run_parser.add_argument('--requests', type=int, help='Stop after this many measured requests')
+    run_parser.add_argument('--warmup', type=float, default=5, help='Unrecorded seconds before measuring')
+    run_parser.add_argument('--keys', choices=('uniform', 'zipf'), default='uniform')
+    run_parser.add_argument('--key-count', type=int, default=1000)
+    run_parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    run_parser.add_argument('--mix', type=parse_mix, default=parse_mix('get=80,put=10,patch=5,delete=5'))
+    run_parser.add_argument('--no-preload', dest='preload', action='store_false', help='Skip writing every key first')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    run_parser.add_argument('--produce-latency-ms', type=float, default=0,
+                            help='Simulated broker latency per produce (in-process only)')
+    run_parser.add_argument('--output', help='Write the JSON results to this file')
+
+    compare_parser = commands.add_parser('compare', help='Compare two saved runs')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--max-regression', type=float,
+                                help='Exit 1 if any throughput/latency figure is this many percent worse')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        return compare(args)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,6 +18,7 @@ setup(
         "kafka-python",
         "redis",
         "mongoengine",
+        "prometheus-client",
         "opentelemetry-api",
         "opentelemetry-sdk",
         "opentelemetry-instrumentation",
@@ -29,6 +30,10 @@ setup(
         "opentelemetry-exporter-otlp",
         "opentelemetry-exporter-otlp-proto-grpc"
     ],
+    extras_require={
+        "fast-codecs": ["orjson", "msgpack"],
+        "compression": ["lz4", "zstandard"],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Topic :: Utilities",
@@ -1,151 +1,520 @@
-import json
+import asyncio
+import collections
+import contextvars
 import os
+import random
+import re
+import socket
+import threading
 import time
-import redis
+import uuid
+import weakref
+from typing import Optional
+import redis.asyncio as redis
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from kafka import KafkaProducer, KafkaConsumer, KafkaAdminClient
+from kafka import KafkaProducer, KafkaAdminClient
 from kafka.admin import NewTopic
-from kafka.errors import KafkaTimeoutError, TopicAlreadyExistsError, NoBrokersAvailable
+from concurrent.futures import ThreadPoolExecutor
+from kafka.errors import KafkaError, KafkaTimeoutError, TopicAlreadyExistsError
 from opentelemetry import trace
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from opentelemetry.instrumentation.pymongo import PymongoInstrumentor
 from opentelemetry.instrumentation.redis import RedisInstrumentor
-from opentelemetry.sdk.resources import Resource as OTResource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.propagate import set_global_textmap
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+from codec import cache_codec, content_type_header, get_codec, kafka_codec
+from config import KAFKA_REPLICATION_FACTOR, KAFKA_TOPIC_PARTITIONS
+from direct_reads import DIRECT_READ_CACHE_TTL_SECONDS, DIRECT_READS_ENABLED, SEARCH_ENABLED, DirectReader
+from health import DEPENDENCY_RETRY, HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT, DependencyStatus
+from kafka_settings import ensure_kafka_topics, producer_config, producer_metrics_summary
+from local_cache import LocalCache
+from metrics import (
+    CACHE_LOOKUPS, CIRCUIT_STATE, HTTP_IN_FLIGHT, KAFKA_PRODUCE_ACK_LATENCY, KAFKA_REPLY_WAIT, L1_CACHE_ENTRIES,
+    REDIS_LATENCY, REDIS_POOL_CONNECTIONS, REDIS_POOL_MAX_CONNECTIONS, REPLIES_PENDING, REQUEST_QUEUE_WAIT,
+    REQUESTS_QUEUED, REQUESTS_SHED, observe_latency, render_metrics, trace_exemplar,
+)
+from logging_setup import configure_logging, shutdown_logging
+from overload import CircuitBreaker, ConcurrencyLimiter, DeadlineExceeded, Overloaded
+from redis_settings import REDIS_MODE, build_redis_clients, close_redis_clients, pool_usage
+from reply_dispatcher import ReplyDispatcher
+from search import SORT_FIELDS, SearchError, build_query, encode_cursor, parse_fields
+from tracing import build_tracer_provider
 
-# Initialize logging
-class CustomFormatter(logging.Formatter):
-    def format(self, record):
-        record.trace_id = getattr(record, 'trace_id', 'N/A')
-        record.span_id = getattr(record, 'span_id', 'N/A')
-        record.parent_span_id = getattr(record, 'parent_span_id', 'N/A')
-        return super().format(record)
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s [Trace ID: %(trace_id)s] [Span ID: %(span_id)s] [Parent Span ID: %(parent_span_id)s] %(message)s')
+# Initialize logging: trace/span ids are attached by a filter and records are
+# written by a background thread (see logging_setup)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Ensure that the CustomFormatter is used in all handlers
-for handler in logging.root.handlers:
-    handler.setFormatter(CustomFormatter(handler.formatter._fmt))
-
-# Set Kafka library logging level to WARNING to reduce verbosity
-kafka_logger = logging.getLogger('kafka')
-kafka_logger.setLevel(logging.WARNING)
+# Initialize FastAPI app; connections are set up and torn down by the lifespan
+# handler (startup/shutdown below) rather than at import
+@asynccontextmanager
+async def lifespan(app):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
 
-# Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # OpenTelemetry tracing setup
 if os.getenv('ENABLE_TRACING', 'false').lower() == 'true':
     otlp_endpoint = os.getenv('OTLP_ENDPOINT', 'localhost:4317')
-    resource = OTResource.create({"service.name": "test-app-api-gateway"})
-    provider = TracerProvider(resource=resource)
-    processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint, insecure=True))
-    provider.add_span_processor(processor)
+    provider = build_tracer_provider("test-app-api-gateway", otlp_endpoint)
     trace.set_tracer_provider(provider)
 
     FastAPIInstrumentor.instrument_app(app)
     RedisInstrumentor().instrument()
+    if DIRECT_READS_ENABLED or SEARCH_ENABLED:
+        PymongoInstrumentor().instrument()
 
 tracer = trace.get_tracer(__name__)
 
-# Initialize Redis client with connection pool
-redis_pool = redis.ConnectionPool(
-    host=os.getenv('REDIS_HOST', 'localhost'),
-    port=6379,
-    db=0,
-    password=os.getenv('REDIS_PASSWORD'),
-    max_connections=20
-)
-redis_client = redis.StrictRedis(connection_pool=redis_pool)
+# Async Redis clients (see redis_settings for the pool, timeout and topology
+# settings): redis_client for writes, locks and publishing, redis_reader for
+# cache reads (replicas when enabled) and redis_subscriber for pub/sub
+redis_client, redis_reader, redis_subscriber = build_redis_clients()
+REDIS_POOL_CONNECTIONS.labels(state='in_use').set_function(
+    lambda: pool_usage(redis_client, redis_reader, redis_subscriber)[0])
+REDIS_POOL_CONNECTIONS.labels(state='idle').set_function(
+    lambda: pool_usage(redis_client, redis_reader, redis_subscriber)[1])
+REDIS_POOL_MAX_CONNECTIONS.set_function(lambda: pool_usage(redis_client, redis_reader, redis_subscriber)[2])
 
-def check_redis():
+# Last known state of each dependency, reported by /readyz
+dependency_status = DependencyStatus('redis', 'kafka', 'replies')
+
+async def check_redis():
     try:
-        redis_client.ping()
-        logger.info("Redis connection successful.")
+        await asyncio.wait_for(redis_client.ping(), timeout=HEALTH_CHECK_TIMEOUT)
+        dependency_status.mark('redis', True)
         return True
-    except redis.ConnectionError as e:
-        logger.error(f"Redis connection failed: {e}")
+    except (redis.RedisError, asyncio.TimeoutError) as e:
+        dependency_status.mark('redis', False, f"{type(e).__name__}: {e}")
         return False
 
 # Kafka configuration
 kafka_broker = os.getenv('KAFKA_BROKER', 'localhost:9092')
 
+# One admin client for topic setup and health checks, created on first connect
+kafka_admin = None
+kafka_admin_lock = threading.Lock()
+
 def check_kafka():
+    with kafka_admin_lock:
+        if kafka_admin is None:
+            return False
+        try:
+            kafka_admin.list_topics()
+            dependency_status.mark('kafka', True)
+            return True
+        except Exception as e:
+            dependency_status.mark('kafka', False, f"{type(e).__name__}: {e}")
+            return False
+
+async def check_kafka_async():
     try:
-        admin_client = KafkaAdminClient(bootstrap_servers=kafka_broker)
-        admin_client.list_topics()
-        logger.info("Kafka connection successful.")
-        return True
-    except NoBrokersAvailable as e:
-        logger.error(f"Kafka connection failed: {e}")
+        return await asyncio.wait_for(asyncio.to_thread(check_kafka), timeout=HEALTH_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        dependency_status.mark('kafka', False, f"No answer within {HEALTH_CHECK_TIMEOUT}s")
         return False
 
-# Kafka topic setup
-def ensure_kafka_topics():
-    admin_client = KafkaAdminClient(bootstrap_servers=kafka_broker)
-    topics = ['data_requests', 'data_responses']
-    existing_topics = admin_client.list_topics()
-    for topic in topics:
-        if topic not in existing_topics:
-            try:
-                admin_client.create_topics([NewTopic(name=topic, num_partitions=1, replication_factor=1)])
-                logger.info(f"Created Kafka topic: {topic}")
-            except TopicAlreadyExistsError:
-                logger.info(f"Kafka topic {topic} already exists")
+# Kafka topic setup: the shared topics (see kafka_settings), plus this
+# instance's private reply topic when replies are routed by topic
+def ensure_gateway_topics(admin_client):
+    existing_topics = ensure_kafka_topics(admin_client)
+    if reply_partition is None and reply_topic not in existing_topics:
+        try:
+            admin_client.create_topics([NewTopic(
+                name=reply_topic, num_partitions=1, replication_factor=KAFKA_REPLICATION_FACTOR,
+                topic_configs={'retention.ms': reply_topic_retention_ms}
+            )])
+            logger.info(f"Created reply topic: {reply_topic}")
+        except TopicAlreadyExistsError:
+            logger.info(f"Reply topic {reply_topic} already exists")
+
+def delete_reply_topic():
+    if reply_partition is not None or kafka_admin is None:
+        return
+    try:
+        with kafka_admin_lock:
+            kafka_admin.delete_topics([reply_topic])
+        logger.info(f"Deleted reply topic: {reply_topic}")
+    except Exception as e:
+        logger.warning(f"Could not delete reply topic {reply_topic}: {e}")
+
+# Kafka producer setup. kafka-python is thread based, so blocking calls
+# (metadata fetches in send()) run on a dedicated I/O thread and delivery
+# results are bridged back to the event loop as asyncio futures.
+kafka_io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kafka-io')
+kafka_send_timeout = float(os.getenv('KAFKA_SEND_TIMEOUT_SECONDS', '3'))
+kafka_send_backoff = float(os.getenv('KAFKA_SEND_BACKOFF_SECONDS', '4'))
+# By default a request is not held on the broker ack: delivery failures are
+# reported through the send callback and fail the pending reply instead.
+kafka_send_await_ack = os.getenv('KAFKA_SEND_AWAIT_ACK', 'false').lower() == 'true'
+
+producer = None
+
+def build_producer():
+    return KafkaProducer(
+        bootstrap_servers=kafka_broker,
+        key_serializer=lambda k: str(k).encode('utf-8'),
+        value_serializer=kafka_codec.encode,
+        retries=5,
+        reconnect_backoff_ms=50,
+        reconnect_backoff_max_ms=1000,
+        # send() blocks on metadata and buffer space; never longer than a send may take
+        max_block_ms=int(kafka_send_timeout * 1000),
+        **producer_config()
+    )
 
-# Kafka producer setup
-producer = KafkaProducer(
+# Reply routing: every gateway instance advertises its own reply address in
+# each request so the data processor answers this instance directly.
+#   REPLY_ROUTING=partition -> partition REPLY_PARTITION of the shared data_responses topic
+#                              (default; the chart sets it to the gateway's StatefulSet pod index)
+#   REPLY_ROUTING=topic     -> private topic data_responses.<INSTANCE_ID>, deleted on graceful
+#                              shutdown only, so a crashed instance leaves its topic behind
+instance_id = re.sub(r'[^a-zA-Z0-9._-]', '-', os.getenv('INSTANCE_ID', socket.gethostname()))
+reply_routing = os.getenv('REPLY_ROUTING', 'partition').lower()
+if reply_routing == 'partition':
+    reply_topic = 'data_responses'
+    reply_partition = int(os.getenv('REPLY_PARTITION', '0'))
+    if reply_partition >= KAFKA_TOPIC_PARTITIONS:
+        # The partition does not exist, so no reply would ever arrive
+        raise ValueError(f"REPLY_PARTITION {reply_partition} is beyond the {KAFKA_TOPIC_PARTITIONS} partitions of {reply_topic}")
+else:
+    reply_topic = f"data_responses.{instance_id}"
+    reply_partition = None
+reply_to = {'topic': reply_topic, 'partition': reply_partition}
+reply_topic_retention_ms = os.getenv('REPLY_TOPIC_RETENTION_MS', '300000')
+
+reply_timeout = float(os.getenv('KAFKA_REPLY_TIMEOUT_SECONDS', '10'))
+reply_dispatcher = ReplyDispatcher(
+    reply_topic,
     bootstrap_servers=kafka_broker,
-    value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-    retries=5,
-    reconnect_backoff_ms=50,
-    reconnect_backoff_max_ms=1000
+    partitions=None if reply_partition is None else [reply_partition],
+)
+
+# Overload protection. API requests (/myapi) pass a concurrency limiter:
+# MAX_CONCURRENT_REQUESTS run at once (0 disables it) and at most
+# MAX_QUEUED_REQUESTS more wait up to MAX_QUEUE_WAIT_SECONDS for a slot; the
+# rest are refused with 503 and Retry-After. Each request gets a deadline
+# REQUEST_DEADLINE_SECONDS after arrival that bounds every wait made on its
+# behalf and travels in the Kafka message, so the processor can drop work
+# nobody is waiting for. Redis, Kafka and the data processor each have a
+# circuit breaker that opens after CIRCUIT_FAILURE_THRESHOLD consecutive
+# failures and lets a trial call through after CIRCUIT_RESET_SECONDS.
+request_limiter = ConcurrencyLimiter(
+    max_concurrent=int(os.getenv('MAX_CONCURRENT_REQUESTS', '200')),
+    max_queue=int(os.getenv('MAX_QUEUED_REQUESTS', '100')),
+    max_wait=float(os.getenv('MAX_QUEUE_WAIT_SECONDS', '1')),
 )
+request_deadline_seconds = float(os.getenv('REQUEST_DEADLINE_SECONDS', str(reply_timeout)))
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+circuit_failure_threshold = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+circuit_reset_seconds = float(os.getenv('CIRCUIT_RESET_SECONDS', '10'))
+redis_breaker = CircuitBreaker('redis', circuit_failure_threshold, circuit_reset_seconds)
+kafka_breaker = CircuitBreaker('kafka', circuit_failure_threshold, circuit_reset_seconds)
+processor_breaker = CircuitBreaker('processor', circuit_failure_threshold, circuit_reset_seconds)
+mongo_breaker = CircuitBreaker('mongo', circuit_failure_threshold, circuit_reset_seconds)
+
+def time_remaining():
+    """Seconds left before the current request's deadline, or None outside a request."""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def bounded_by_deadline(timeout):
+    remaining = time_remaining()
+    return timeout if remaining is None else min(timeout, remaining)
+
+def deadline_exceeded_response(exc):
+    return HTTPException(status_code=504, detail=f"Request deadline exceeded: {exc}")
+
+def overloaded_response(exc):
+    REQUESTS_SHED.labels(reason=exc.reason).inc()
+    return HTTPException(
+        status_code=503, detail=f"Service overloaded ({exc.reason})", headers={'Retry-After': exc.retry_after_header}
+    )
 
-# Initialize request_contexts dictionary
-request_contexts = {}
+def connect_kafka():
+    """Create the admin client and producer, ensure the topics and start the reply dispatcher.
 
-# Define getter and setter functions for context propagation
+    Blocking and idempotent: each step that already succeeded is skipped, so a
+    failed attempt can simply be retried.
+    """
+    global kafka_admin, producer
+    with kafka_admin_lock:
+        if kafka_admin is None:
+            kafka_admin = KafkaAdminClient(bootstrap_servers=kafka_broker)
+        ensure_gateway_topics(kafka_admin)
+    dependency_status.mark('kafka', True)
+    if producer is None:
+        producer = build_producer()
+    reply_dispatcher.start()
+    if not reply_dispatcher.wait_ready(reply_timeout):
+        raise KafkaTimeoutError(f"Reply dispatcher not ready on {reply_topic} after {reply_timeout}s")
+    dependency_status.mark('replies', True)
+
+# W3C trace context propagation into Kafka headers
 propagator = TraceContextTextMapPropagator()
 
-class DictGetter:
-    def get(self, carrier, key):
-        return carrier.get(key, None)
+# In-process L1 cache of deserialized items in front of Redis. Writes evict the
+# local entry and publish the id on a Redis channel so other replicas evict too.
+local_cache = LocalCache(
+    max_items=int(os.getenv('L1_CACHE_MAX_ITEMS', '10000')),
+    ttl_seconds=float(os.getenv('L1_CACHE_TTL_SECONDS', '5')),
+)
+cache_invalidation_channel = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+invalidation_listener = None
+
+async def invalidate_cached_item(entered_id):
+    local_cache.invalidate(entered_id)
+    try:
+        await redis_client.publish(cache_invalidation_channel, str(entered_id))
+    except redis.RedisError as e:
+        logger.warning("Could not publish cache invalidation for ID %s: %s", entered_id, e)
+
+async def listen_for_invalidations():
+    """Evict L1 entries invalidated by other replicas; reconnects on Redis errors."""
+    while True:
+        try:
+            pubsub = redis_subscriber.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(cache_invalidation_channel)
+            async for message in pubsub.listen():
+                local_cache.invalidate(int(message['data']))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Cache invalidation listener error, resubscribing: %s", e)
+            # Entries written while disconnected may have been missed
+            local_cache.clear()
+            await asyncio.sleep(1)
 
-class DictSetter:
-    def set(self, carrier, key, value):
-        carrier[key] = value
+# Read counts for cache warming: GETs are counted in memory and added to the
+# CACHE_ACCESS_COUNTER_KEY sorted set every CACHE_ACCESS_FLUSH_SECONDS (0
+# disables), so cache_sync can warm Redis with the most-read ids.
+cache_access_counter_key = os.getenv('CACHE_ACCESS_COUNTER_KEY', 'cache:access_counts')
+cache_access_flush_seconds = float(os.getenv('CACHE_ACCESS_FLUSH_SECONDS', '10'))
+access_counts = collections.Counter()
+access_count_flusher = None
 
-getter = DictGetter()
-setter = DictSetter()
+def record_access(entered_id):
+    if cache_access_flush_seconds > 0:
+        access_counts[entered_id] += 1
+
+async def flush_access_counts():
+    global access_counts
+    while True:
+        await asyncio.sleep(cache_access_flush_seconds)
+        if not access_counts:
+            continue
+        counts, access_counts = access_counts, collections.Counter()
+        pipeline = redis_client.pipeline(transaction=False)
+        for entered_id, count in counts.items():
+            pipeline.zincrby(cache_access_counter_key, count, entered_id)
+        try:
+            with observe_latency(REDIS_LATENCY, operation='access_counts'):
+                await pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning("Could not record access counts for %d IDs: %s", len(counts), e)
+
+# Redis cache policy: entries expire after CACHE_TTL_SECONDS, spread by up to
+# CACHE_TTL_JITTER (a fraction of the TTL) so keys written together do not all
+# expire together. Lookups that found nothing are cached as JSON null for
+# CACHE_NEGATIVE_TTL_SECONDS (0 disables negative caching).
+# Fills after a read use SET NX, so a GET that read a document before a write
+# cannot replace what the write stored; a DELETE stores null for
+# CACHE_TOMBSTONE_TTL_SECONDS for the same reason.
+cache_ttl = int(os.getenv('CACHE_TTL_SECONDS', '300'))
+cache_ttl_jitter = float(os.getenv('CACHE_TTL_JITTER', '0.1'))
+cache_negative_ttl = int(os.getenv('CACHE_NEGATIVE_TTL_SECONDS', '5'))
+cache_tombstone_ttl = int(os.getenv('CACHE_TOMBSTONE_TTL_SECONDS', '10'))
+MISSING_MARKER = b'null'
+# Serve Redis hits as the stored bytes when they are already JSON (json/orjson codecs)
+cache_raw_responses = os.getenv('CACHE_RAW_RESPONSES', 'false').lower() == 'true' and cache_codec.json_compatible
+
+def cache_ttl_with_jitter(ttl):
+    return max(1, int(ttl * (1 + random.uniform(-cache_ttl_jitter, cache_ttl_jitter))))
 
 # Redis helper functions
-def get_data_from_redis(entered_id):
-    data = redis_client.get(entered_id)
-    logger.info(f"Redis get for ID {entered_id}: {data}")
+async def get_data_from_redis(entered_id):
+    # A failing Redis is treated as a miss; while its circuit is open it is not asked at all
+    if not redis_breaker.allow():
+        return None
+    try:
+        with observe_latency(REDIS_LATENCY, operation='get'):
+            data = await redis_reader.get(entered_id)
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Redis get failed for ID %s: %s", entered_id, e)
+        return None
+    redis_breaker.record_success()
+    logger.debug("Redis get for ID %s: %s", entered_id, data)
     return data
 
-def cache_data_in_redis(entered_id, data):
+async def cache_data_in_redis(entered_id, data, ttl=None, fill=False):
+    """Cache an item (for ttl seconds instead of CACHE_TTL_SECONDS if given).
+
+    fill marks a cache fill after a read, which never replaces an existing
+    entry. Returns False if Redis could not be written; the data is still good
+    to serve.
+    """
     if '_id' in data:
         data['id'] = data.pop('_id')
-    redis_client.set(entered_id, json.dumps(data))
-    logger.info(f"Redis set for ID {entered_id}: {data}")
+    try:
+        with observe_latency(REDIS_LATENCY, operation='set'):
+            await redis_client.set(entered_id, cache_codec.encode(data), nx=fill,
+                                   ex=cache_ttl_with_jitter(cache_ttl if ttl is None else ttl))
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Redis set failed for ID %s: %s", entered_id, e)
+        return False
+    redis_breaker.record_success()
+    logger.debug("Redis set for ID %s: %s", entered_id, data)
+    return True
+
+def decode_cached(entered_id, cached_data):
+    """Decode a Redis value; entries written with another codec count as misses."""
+    try:
+        return cache_codec.decode(cached_data)
+    except Exception as e:
+        logger.debug("Undecodable cache entry for ID %s: %s", entered_id, e)
+        return None
+
+async def cache_missing_in_redis(entered_id, ttl=None):
+    negative_ttl = cache_negative_ttl if ttl is None else min(ttl, cache_negative_ttl)
+    if negative_ttl <= 0:
+        return
+    try:
+        await redis_client.set(entered_id, MISSING_MARKER, nx=True, ex=cache_ttl_with_jitter(negative_ttl))
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Redis negative cache write failed for ID %s: %s", entered_id, e)
+        return
+    redis_breaker.record_success()
+
+async def store_tombstone(entered_id):
+    try:
+        await redis_client.set(entered_id, MISSING_MARKER, ex=cache_tombstone_ttl)
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Redis tombstone write failed for ID %s: %s", entered_id, e)
+        return False
+    return True
+
+async def update_cache_after_write(entered_id, data, deleted=False):
+    """Write-through a PUT/PATCH result, tombstone a confirmed DELETE, or evict when the outcome is unknown."""
+    if data:
+        written = await cache_data_in_redis(entered_id, data)
+    elif deleted and cache_tombstone_ttl > 0:
+        written = await store_tombstone(entered_id)
+    else:
+        written = False
+    # Never serve a stale entry: a failed write falls back to eviction
+    if not written:
+        try:
+            await redis_client.delete(entered_id)
+        except redis.RedisError as e:
+            logger.error("Redis eviction failed for ID %s: %s", entered_id, e)
+    await invalidate_cached_item(entered_id)
+    if data:
+        local_cache.set(entered_id, data)
 
 # Kafka message helper functions
-def send_message_to_kafka(request_type, entered_id, data, context=None):
+async def send_on_io_thread(topic, value, key=None, headers=None):
+    """Call producer.send on the Kafka I/O thread, waiting no longer than the request deadline allows."""
+    loop = asyncio.get_running_loop()
+    timeout = bounded_by_deadline(kafka_send_timeout)
+    if timeout <= 0:
+        raise DeadlineExceeded(f"no time left to send to {topic}")
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(kafka_io_executor, lambda: producer.send(topic, key=key, value=value, headers=headers)),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError as e:
+        # Only a send that used its full allowance counts against Kafka
+        if timeout < kafka_send_timeout:
+            raise DeadlineExceeded(f"sending to {topic}") from e
+        kafka_breaker.record_failure()
+        raise KafkaTimeoutError(f"Timed out queueing a record for {topic}") from e
+    except Exception:
+        # e.g. a metadata timeout raised by send() itself
+        kafka_breaker.record_failure()
+        raise
+
+async def produce_async(topic, value, key=None, headers=None, timeout=None):
+    """Produce a record and await the broker ack without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    started, exemplar = time.perf_counter(), trace_exemplar()
+    kafka_future = await send_on_io_thread(topic, value, key=key, headers=headers)
+    result = loop.create_future()
+
+    def on_success(record_metadata):
+        KAFKA_PRODUCE_ACK_LATENCY.labels(topic=topic).observe(time.perf_counter() - started, exemplar=exemplar)
+        kafka_breaker.record_success()
+        loop.call_soon_threadsafe(lambda: result.done() or result.set_result(record_metadata))
+
+    def on_error(exc):
+        kafka_breaker.record_failure()
+        loop.call_soon_threadsafe(lambda: result.done() or result.set_exception(exc))
+
+    kafka_future.add_callback(on_success)
+    kafka_future.add_errback(on_error)
+    limit = kafka_send_timeout if timeout is None else timeout
+    bounded = bounded_by_deadline(limit)
+    try:
+        return await asyncio.wait_for(result, timeout=max(0.0, bounded))
+    except asyncio.TimeoutError as e:
+        if bounded < limit:
+            raise DeadlineExceeded(f"waiting for the ack from {topic}") from e
+        kafka_breaker.record_failure()
+        raise KafkaTimeoutError(f"Timed out waiting for ack from {topic}") from e
+
+async def produce_with_callback(topic, value, correlation_id, key=None, headers=None):
+    """Queue a record without waiting for the ack; a failed delivery fails the pending reply."""
+    started, exemplar = time.perf_counter(), trace_exemplar()
+    kafka_future = await send_on_io_thread(topic, value, key=key, headers=headers)
+
+    def on_success(record_metadata):
+        KAFKA_PRODUCE_ACK_LATENCY.labels(topic=topic).observe(time.perf_counter() - started, exemplar=exemplar)
+        kafka_breaker.record_success()
+
+    def on_error(exc):
+        logger.error("Failed to deliver request %s to Kafka: %s", correlation_id, exc)
+        kafka_breaker.record_failure()
+        reply_dispatcher.fail(correlation_id, exc)
+
+    kafka_future.add_callback(on_success)
+    kafka_future.add_errback(on_error)
+
+async def send_message_to_kafka(request_type, entered_id, data, context=None):
+    """Send a request to the data processor and return its correlation ID."""
+    if producer is None or not reply_dispatcher.ready:
+        raise HTTPException(status_code=503, detail="Not connected to Kafka yet")
+    try:
+        kafka_breaker.check()
+        processor_breaker.check()
+    except Overloaded as e:
+        raise overloaded_response(e)
     with tracer.start_as_current_span("send_message_to_kafka") as span:
+        correlation_id = uuid.uuid4().hex
+        remaining = time_remaining()
+        if remaining is not None and remaining <= 0:
+            raise deadline_exceeded_response("before the request was sent")
         message = {
             'type': request_type,
             'id': entered_id,
-            'data': data
+            'data': data,
+            # Also the request id the processor deduplicates redeliveries by
+            'correlation_id': correlation_id,
+            'reply_to': reply_to,
+            # Wall-clock deadline after which the processor drops the request
+            'deadline': None if remaining is None else time.time() + remaining
         }
 
         # Inject context only if it does not already exist
@@ -154,56 +523,222 @@ def send_message_to_kafka(request_type, entered_id, data, context=None):
         propagator.inject(carrier, context=current_context)
         
         # Ensure no duplicate traceparent headers
-        headers = {k: v for k, v in carrier.items()}
-        if 'traceparent' in headers:
-            headers = [(key, bytes(value, 'utf-8')) for key, value in headers.items() if key == 'traceparent']
+        headers = [(key, bytes(value, 'utf-8')) for key, value in carrier.items() if key == 'traceparent']
+        headers.append(content_type_header(kafka_codec))
 
-        logger.info(f"Sending message to Kafka: {message}")
-        logger.info(f"Span context before sending: Trace ID: {span.get_span_context().trace_id}, Span ID: {span.get_span_context().span_id}")
-        logger.info(f"Injected headers: {carrier}")
+        logger.debug("Sending message to Kafka: %s (headers %s)", message, carrier)
 
+        # Register before producing so a fast reply cannot arrive unclaimed
+        reply_dispatcher.register(correlation_id)
+        if not kafka_send_await_ack:
+            try:
+                await produce_with_callback('data_requests', message, correlation_id, key=entered_id, headers=headers)
+                return correlation_id
+            except DeadlineExceeded as e:
+                reply_dispatcher.discard(correlation_id)
+                raise deadline_exceeded_response(e)
+            except Exception as e:
+                logger.error("Failed to queue message for Kafka: %s", e)
+                reply_dispatcher.discard(correlation_id)
+                raise HTTPException(status_code=503, detail=f"Could not deliver request to Kafka: {e}")
         for attempt in range(3):
             try:
-                future = producer.send('data_requests', value=message, headers=headers)
-                record_metadata = future.get(timeout=3)
-                logger.info(f"Message sent to Kafka topic={record_metadata.topic}, partition={record_metadata.partition}, offset={record_metadata.offset}")
-                return
+                record_metadata = await produce_async('data_requests', message, key=entered_id, headers=headers)
+                logger.debug("Message sent to Kafka topic=%s, partition=%s, offset=%s", record_metadata.topic, record_metadata.partition, record_metadata.offset)
+                return correlation_id
+            except DeadlineExceeded as e:
+                reply_dispatcher.discard(correlation_id)
+                raise deadline_exceeded_response(e)
             except KafkaTimeoutError as e:
-                logger.error(f"Failed to send message to Kafka (attempt {attempt + 1}/3): {e}")
-                time.sleep(4)
+                logger.error("Failed to send message to Kafka (attempt %d/3): %s", attempt + 1, e)
+                # Back off only if another attempt can still finish within the deadline
+                remaining = time_remaining()
+                if attempt == 2 or (remaining is not None and remaining <= kafka_send_backoff):
+                    break
+                await asyncio.sleep(kafka_send_backoff)
             except Exception as e:
-                logger.error(f"Unexpected error: {e}")
-                return
+                logger.error("Unexpected error: %s", e)
+                break
+        reply_dispatcher.discard(correlation_id)
+        # Never None here: callers would read it as "not found"
+        raise HTTPException(status_code=503, detail="Could not deliver request to Kafka")
 
-def get_result_from_kafka(entered_id):
-    consumer = KafkaConsumer(
-        'data_responses',
-        bootstrap_servers=kafka_broker,
-        auto_offset_reset='latest',
-        enable_auto_commit=True,
-        group_id='api_gateway_group',
-        value_deserializer=lambda v: json.loads(v.decode('utf-8')),
-    )
+async def get_result_from_kafka(correlation_id, timeout=None):
+    if correlation_id is None:
+        return None
+    started = time.perf_counter()
+    limit = reply_timeout if timeout is None else timeout
+    timeout = bounded_by_deadline(limit)
+    try:
+        reply = await reply_dispatcher.wait_async(correlation_id, timeout=max(0.0, timeout))
+    except KafkaError as e:
+        KAFKA_REPLY_WAIT.labels(outcome='error').observe(time.perf_counter() - started, exemplar=trace_exemplar())
+        raise HTTPException(status_code=503, detail=f"Could not deliver request to Kafka: {e}")
+    KAFKA_REPLY_WAIT.labels(outcome='timeout' if reply is None else 'ok').observe(
+        time.perf_counter() - started, exemplar=trace_exemplar())
+    if reply is None:
+        # A missing reply is not a "not found": do not let callers cache it as one
+        if timeout < limit:
+            # The request ran out of time, which says nothing about the processor
+            raise deadline_exceeded_response("waiting for the data processor")
+        processor_breaker.record_failure()
+        raise HTTPException(status_code=504, detail="Timed out waiting for the data processor")
+    processor_breaker.record_success()
+    if reply.get('error'):
+        # The processor could not run the request: not a "not found", so never cached as one
+        raise HTTPException(status_code=503, detail=f"Data processor failed: {reply['error']}")
+    data = reply['data']
+    if data and '_id' in data:
+        data['id'] = data.pop('_id')
+    return data
 
-    for msg in consumer:
-        traceparent_header = next((header[1].decode('utf-8') for header in msg.headers if header[0] == 'traceparent'), None)
-        headers = {'traceparent': traceparent_header} if traceparent_header else {}
-        
-        extracted_context = propagator.extract(carrier=headers, getter=DictGetter())
-
-        with tracer.start_as_current_span("process_kafka_message", context=extracted_context) as span:
-            logger.info(f"Using span: Trace ID: {span.get_span_context().trace_id}, Span ID: {span.get_span_context().span_id}")
-            
-            if msg.value['id'] == entered_id:
-                consumer.close()
-                data = msg.value['data']
-                if data and '_id' in data:
-                    data['id'] = data.pop('_id')
-                return data
+# Single-flight cache fills: concurrent misses for the same id in this process
+# share one backend fetch, and a short Redis lock lets other replicas wait for
+# the cache to be filled instead of issuing the same fetch.
+single_flight_distributed = os.getenv('SINGLE_FLIGHT_DISTRIBUTED', 'true').lower() == 'true'
+single_flight_wait = float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', str(reply_timeout)))
+single_flight_poll_interval = float(os.getenv('SINGLE_FLIGHT_POLL_INTERVAL_SECONDS', '0.05'))
+inflight_fetches = {}
 
-    consumer.close()
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Direct reads (see direct_reads): cache misses are read from a MongoDB
+# secondary when enabled and connected, falling back to Kafka on any error.
+# Searches use the same read-only pool.
+direct_reader = DirectReader() if DIRECT_READS_ENABLED or SEARCH_ENABLED else None
+
+async def fetch_many_directly(ids):
+    """Items found for ids read straight from MongoDB, or None to use the Kafka path."""
+    if not DIRECT_READS_ENABLED or not direct_reader.available or not mongo_breaker.allow():
+        return None
+    try:
+        items = await direct_reader.find_many(ids)
+    except Exception as e:
+        mongo_breaker.record_failure()
+        logger.warning("Direct read of %d IDs failed, falling back to Kafka: %s", len(ids), e)
+        return None
+    mongo_breaker.record_success()
+    return items
+
+def local_ttl(ttl):
+    """L1 lifetime for entries Redis keeps for ttl seconds (None: the L1 default)."""
+    return None if ttl is None else min(ttl, local_cache.ttl_seconds)
+
+async def fetch_item_from_backend(entered_id):
+    """Fetch an item from MongoDB or through Kafka and fill the caches; returns None if it does not exist."""
+    items = await fetch_many_directly([entered_id])
+    # A secondary may lag a recent write, so its answer is only cached briefly
+    ttl = DIRECT_READ_CACHE_TTL_SECONDS if items is not None else None
+    if items is not None:
+        data = items[0] if items else None
+    else:
+        correlation_id = await send_message_to_kafka('GET', entered_id, None)
+        data = await get_result_from_kafka(correlation_id)
+        if data and 'error' in data:
+            raise HTTPException(status_code=400, detail=data['error'])
+
+    if ttl == 0:
+        return data or None
+    if data:
+        logger.debug("Fetched data for ID %s. Caching the data.", entered_id)
+        await cache_data_in_redis(entered_id, data, ttl, fill=True)
+        local_cache.set(entered_id, data, local_ttl(ttl))
+        return data
+
+    await cache_missing_in_redis(entered_id, ttl)
     return None
 
+async def fill_lock_held(lock_key):
+    """Whether another replica still holds the fill lock; False when Redis cannot tell."""
+    if not redis_breaker.allow():
+        return False
+    try:
+        held = await redis_client.exists(lock_key)
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Could not check fill lock %s: %s", lock_key, e)
+        return False
+    redis_breaker.record_success()
+    return bool(held)
+
+async def wait_for_cache_fill(entered_id, lock_key, wait_until):
+    """Poll Redis while another replica holds the fill lock; returns (filled, data).
+
+    Stops early, unfilled, once the lock is gone without a value: its holder
+    failed or did not cache the result.
+    """
+    loop = asyncio.get_running_loop()
+    while loop.time() < wait_until:
+        await asyncio.sleep(single_flight_poll_interval)
+        cached_data = await get_data_from_redis(entered_id)
+        if cached_data == MISSING_MARKER:
+            return True, None
+        if cached_data:
+            data = decode_cached(entered_id, cached_data)
+            if data is not None:
+                local_cache.set(entered_id, data)
+                return True, data
+        if not await fill_lock_held(lock_key):
+            break
+    return False, None
+
+async def acquire_fill_lock(lock_key, token):
+    """Try to take the cross-replica fill lock; returns None when Redis cannot be asked."""
+    if not redis_breaker.allow():
+        return None
+    try:
+        acquired = await redis_client.set(lock_key, token, nx=True, px=int(single_flight_wait * 1000))
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Could not take fill lock %s: %s", lock_key, e)
+        return None
+    redis_breaker.record_success()
+    return bool(acquired)
+
+async def fetch_item_coalesced(entered_id):
+    lock_key = f"lock:{entered_id}"
+    token = uuid.uuid4().hex
+    acquired = False
+    if single_flight_distributed:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        wait_until = started + bounded_by_deadline(single_flight_wait)
+        # Without Redis (None) there is no lock to wait on: fetch directly
+        acquired = await acquire_fill_lock(lock_key, token)
+        while acquired is False:
+            filled, data = await wait_for_cache_fill(entered_id, lock_key, wait_until)
+            if filled:
+                return data
+            if loop.time() >= wait_until:
+                logger.warning("Cache fill for ID %s did not complete in %.2fs; fetching directly",
+                               entered_id, loop.time() - started)
+                break
+            # The holder let go without filling the cache: take the fill over
+            acquired = await acquire_fill_lock(lock_key, token)
+    try:
+        return await fetch_item_from_backend(entered_id)
+    finally:
+        if acquired:
+            try:
+                await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except redis.RedisError as e:
+                logger.warning("Could not release fill lock for ID %s: %s", entered_id, e)
+
+async def fetch_item_once(entered_id):
+    """Await the single in-flight fetch for entered_id, starting it if needed."""
+    task = inflight_fetches.get(entered_id)
+    if task is None:
+        task = asyncio.ensure_future(fetch_item_coalesced(entered_id))
+        inflight_fetches[entered_id] = task
+        task.add_done_callback(lambda _: inflight_fetches.pop(entered_id, None))
+    # Shield so one caller disconnecting does not cancel the fetch for the others
+    return await asyncio.shield(task)
+
 # Define Pydantic models
 class BaseItem(BaseModel):
     name: str
@@ -213,6 +748,70 @@ class BaseItem(BaseModel):
 class Item(BaseItem):
     id: int
 
+# Prometheus metrics
+REPLIES_PENDING.set_function(lambda: reply_dispatcher.pending_count)
+L1_CACHE_ENTRIES.set_function(lambda: len(local_cache))
+REQUESTS_QUEUED.set_function(lambda: request_limiter.waiting)
+CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+for breaker in (redis_breaker, kafka_breaker, processor_breaker, mongo_breaker):
+    CIRCUIT_STATE.labels(dependency=breaker.name).set_function(lambda breaker=breaker: CIRCUIT_STATE_VALUES[breaker.state])
+
+@app.middleware("http")
+async def track_in_flight(request: Request, call_next):
+    with HTTP_IN_FLIGHT.track_inprogress():
+        return await call_next(request)
+
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    """Admit API requests through the concurrency limiter and start their deadline."""
+    if not request.url.path.startswith('/myapi'):
+        return await call_next(request)
+    deadline = time.monotonic() + request_deadline_seconds
+    token = request_deadline.set(deadline)
+    started = time.perf_counter()
+    try:
+        await request_limiter.acquire(deadline)
+    except Overloaded as e:
+        request_deadline.reset(token)
+        error = overloaded_response(e)
+        return JSONResponse(status_code=error.status_code, content={'detail': error.detail}, headers=error.headers)
+    REQUEST_QUEUE_WAIT.observe(time.perf_counter() - started)
+    release = release_once(request_limiter.release)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        release()
+        raise
+    finally:
+        request_deadline.reset(token)
+    # The body (an NDJSON batch or search stream included) is sent after this
+    # returns, so the slot is held until the stream is done
+    response.body_iterator = release_after_stream(response.body_iterator, release)
+    # A stream cancelled before its first chunk never runs its finally
+    weakref.finalize(response.body_iterator, release)
+    return response
+
+def release_once(release):
+    released = False
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            release()
+    return release_slot
+
+async def release_after_stream(body_iterator, release):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        release()
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    body, content_type = render_metrics(request.headers.get('accept'))
+    return Response(content=body, media_type=content_type)
+
 # Set up Jinja2 templates
 templates = Jinja2Templates(directory="templates")
 
@@ -234,38 +833,258 @@ async def portfolio(request: Request):
 
 @app.get("/myapi/{entered_id}", response_model=Item)
 async def get_item(entered_id: int):
-    logger.info(f"Received GET request for ID {entered_id}")
+    logger.info("Received GET request for ID %s", entered_id)
+    record_access(entered_id)
     with tracer.start_as_current_span("get_request") as span:
-        logger.info(f"Span context: Trace ID: {span.get_span_context().trace_id}, Span ID: {span.get_span_context().span_id}")
-        cached_data = get_data_from_redis(entered_id)
-        if cached_data:
-            logger.info(f"Found cached data for ID {entered_id}")
-            data = json.loads(cached_data)
+        data = local_cache.get(entered_id)
+        CACHE_LOOKUPS.labels(layer='l1', result='miss' if data is None else 'hit').inc()
+        if data is not None:
+            span.set_attribute("cache.l1_hit", True)
+            if isinstance(data, bytes):
+                return Response(content=data, media_type='application/json')
             return data
 
-        logger.info(f"Cached data not found for ID {entered_id}. Sending message to Kafka.")
-        send_message_to_kafka('GET', entered_id, None, context=trace.set_span_in_context(span))
-        data = get_result_from_kafka(entered_id)
-        if data:
-            if 'error' in data:
-                raise HTTPException(status_code=400, detail=data['error'])
-            logger.info(f"Received data from Kafka for ID {entered_id}. Caching the data.")
-            cache_data_in_redis(entered_id, data)
+        cached_data = await get_data_from_redis(entered_id)
+        CACHE_LOOKUPS.labels(layer='redis', result='hit' if cached_data else 'miss').inc()
+        if cached_data == MISSING_MARKER:
+            raise HTTPException(status_code=404, detail=f"Could not find data with ID {entered_id}")
+        if cached_data:
+            logger.debug("Found cached data for ID %s", entered_id)
+            if cache_raw_responses:
+                # Already-encoded JSON: skip decoding and response-model validation
+                local_cache.set(entered_id, cached_data)
+                return Response(content=cached_data, media_type='application/json')
+            data = decode_cached(entered_id, cached_data)
+            if data is not None:
+                local_cache.set(entered_id, data)
+                return data
 
+        logger.debug("Cached data not found for ID %s. Fetching through Kafka.", entered_id)
+        data = await fetch_item_once(entered_id)
+        if data:
             return data
 
         raise HTTPException(status_code=404, detail=f"Could not find data with ID {entered_id}")
 
+# Batch reads: GET /myapi?ids=1,2,3 checks the L1 cache, then Redis with one
+# MGET, then sends whatever is left to the data processor as a single MGET
+# request (one $in query). Items are streamed as NDJSON in the order they are
+# resolved; ids that do not exist or could not be fetched get a line with an
+# "error" field instead.
+batch_read_max_ids = int(os.getenv('BATCH_READ_MAX_IDS', '1000'))
+ndjson_codec = cache_codec if cache_codec.json_compatible else get_codec('json')
+
+def parse_ids(raw_ids):
+    try:
+        ids = [int(part) for part in raw_ids.split(',') if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="No ids given")
+    if len(ids) > batch_read_max_ids:
+        raise HTTPException(status_code=400, detail=f"At most {batch_read_max_ids} ids per request")
+    return ids
+
+async def get_many_from_redis(ids):
+    # Like get_data_from_redis: a failing or circuit-broken Redis reads as all misses
+    if not redis_breaker.allow():
+        return [None] * len(ids)
+    try:
+        with observe_latency(REDIS_LATENCY, operation='mget'):
+            if REDIS_MODE == 'cluster':
+                # Keys hash to different slots, so the cluster client splits the read per node
+                values = await redis_reader.mget_nonatomic(ids)
+            else:
+                values = await redis_reader.mget(ids)
+    except redis.RedisError as e:
+        redis_breaker.record_failure()
+        logger.warning("Redis MGET failed, fetching %d IDs from the backend: %s", len(ids), e)
+        return [None] * len(ids)
+    redis_breaker.record_success()
+    return values
+
+async def cache_many_in_redis(found, missing_ids, ttl=None):
+    """Fill Redis after a batch fetch in one pipelined round trip."""
+    negative_ttl = cache_negative_ttl if ttl is None else min(ttl, cache_negative_ttl)
+    pipeline = redis_client.pipeline(transaction=False)
+    for entered_id, data in found.items():
+        pipeline.set(entered_id, cache_codec.encode(data), nx=True, ex=cache_ttl_with_jitter(cache_ttl if ttl is None else ttl))
+    if negative_ttl > 0:
+        for entered_id in missing_ids:
+            pipeline.set(entered_id, MISSING_MARKER, nx=True, ex=cache_ttl_with_jitter(negative_ttl))
+    with observe_latency(REDIS_LATENCY, operation='pipeline'):
+        await pipeline.execute()
+
+def ndjson_line(data):
+    # Raw cache hits are already JSON
+    return (data if isinstance(data, bytes) else ndjson_codec.encode(data)) + b'\n'
+
+async def stream_batch(resolved, not_found, misses, correlation_id, items=None):
+    try:
+        for data in resolved:
+            yield ndjson_line(data)
+        for entered_id in not_found:
+            yield ndjson_line({'id': entered_id, 'error': 'not found'})
+        if misses:
+            async for line in stream_fetched(misses, correlation_id, items):
+                yield line
+    finally:
+        # The client may disconnect before the reply is awaited
+        if correlation_id is not None:
+            reply_dispatcher.discard(correlation_id)
+
+async def stream_fetched(misses, correlation_id, items=None):
+    """Stream the misses, from items when already read directly or else from the Kafka reply."""
+    # Direct reads come from a secondary that may lag a recent write: cache them briefly
+    ttl = DIRECT_READ_CACHE_TTL_SECONDS if items is not None else None
+    if items is None:
+        if correlation_id is None:
+            for entered_id in misses:
+                yield ndjson_line({'id': entered_id, 'error': 'could not deliver request to Kafka'})
+            return
+        try:
+            items = await get_result_from_kafka(correlation_id) or []
+        except HTTPException as e:
+            for entered_id in misses:
+                yield ndjson_line({'id': entered_id, 'error': e.detail})
+            return
+
+    found = {}
+    for item in items:
+        if '_id' in item:
+            item['id'] = item.pop('_id')
+        found[item['id']] = item
+    missing = [entered_id for entered_id in misses if entered_id not in found]
+    if ttl != 0:
+        try:
+            await cache_many_in_redis(found, missing, ttl)
+        except redis.RedisError as e:
+            logger.warning("Could not cache batch of %d items: %s", len(found), e)
+    for entered_id, item in found.items():
+        if ttl != 0:
+            local_cache.set(entered_id, item, local_ttl(ttl))
+        yield ndjson_line(item)
+    for entered_id in missing:
+        yield ndjson_line({'id': entered_id, 'error': 'not found'})
+
+# Search: GET /myapi with filters (see search) streams matching items as
+# NDJSON straight from a MongoDB cursor read SEARCH_BATCH_SIZE documents at a
+# time. A page holds at most `limit` items (SEARCH_MAX_LIMIT at most); its last
+# line is {"next_cursor": ...}, to be passed as `cursor` for the next page, or
+# null when there are no more.
+search_default_limit = int(os.getenv('SEARCH_DEFAULT_LIMIT', '100'))
+search_max_limit = int(os.getenv('SEARCH_MAX_LIMIT', '1000'))
+search_batch_size = int(os.getenv('SEARCH_BATCH_SIZE', '100'))
+
+async def stream_search(query, projection, sort, sort_spec, limit, returned_fields, cursor):
+    count, last = 0, None
+    try:
+        async for documents in direct_reader.search(query, projection, sort_spec, limit, search_batch_size):
+            for document in documents:
+                last = document
+                count += 1
+                item = {('id' if key == '_id' else key): value for key, value in document.items()}
+                yield ndjson_line({key: value for key, value in item.items() if key in returned_fields})
+        mongo_breaker.record_success()
+    except Exception as e:
+        mongo_breaker.record_failure()
+        logger.error("Search failed after %d items: %s", count, e)
+        # Items already sent stand; the cursor lets the client resume after them
+        yield ndjson_line({'error': 'search failed', 'next_cursor': encode_cursor(sort, last) if last else cursor})
+        return
+    yield ndjson_line({'next_cursor': encode_cursor(sort, last) if count == limit else None})
+
+async def search_items(year, min_price, max_price, name_prefix, fields, sort, limit, cursor):
+    if direct_reader is None:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    if not direct_reader.available or not mongo_breaker.allow():
+        raise overloaded_response(Overloaded('mongo_unavailable', mongo_breaker.retry_after or DEPENDENCY_RETRY))
+    limit = search_default_limit if limit is None else limit
+    if not 1 <= limit <= search_max_limit:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {search_max_limit}")
+    try:
+        query, sort_spec = build_query(year, min_price, max_price, name_prefix, sort, cursor)
+        projection = parse_fields(fields)
+    except SearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    returned_fields = {'id' if field == '_id' else field for field in projection}
+    # The sort field is needed for the next cursor even when it is not returned
+    projection[SORT_FIELDS[sort]] = 1
+    logger.info("Received search request: %s sorted by %s, limit %d", query, sort, limit)
+    return StreamingResponse(
+        stream_search(query, projection, sort, sort_spec, limit, returned_fields, cursor), media_type='application/x-ndjson')
+
+@app.get("/myapi")
+async def get_items(ids: Optional[str] = None, year: Optional[str] = None, min_price: Optional[int] = None,
+                    max_price: Optional[int] = None, name_prefix: Optional[str] = None, fields: Optional[str] = None,
+                    sort: str = 'id', limit: Optional[int] = None, cursor: Optional[str] = None):
+    """Batch read by `ids`, or search when no ids are given."""
+    if ids is None:
+        return await search_items(year, min_price, max_price, name_prefix, fields, sort, limit, cursor)
+    if any(value is not None for value in (year, min_price, max_price, name_prefix, fields, limit, cursor)):
+        raise HTTPException(status_code=400, detail="ids cannot be combined with search parameters")
+    entered_ids = parse_ids(ids)
+    logger.info("Received batch GET request for %d IDs", len(entered_ids))
+    for entered_id in entered_ids:
+        record_access(entered_id)
+    with tracer.start_as_current_span("batch_get_request") as span:
+        span.set_attribute("batch.size", len(entered_ids))
+        resolved, not_found, remaining = [], [], []
+        for entered_id in entered_ids:
+            data = local_cache.get(entered_id)
+            if data is None:
+                remaining.append(entered_id)
+            else:
+                resolved.append(data)
+        CACHE_LOOKUPS.labels(layer='l1', result='hit').inc(len(resolved))
+        CACHE_LOOKUPS.labels(layer='l1', result='miss').inc(len(remaining))
+
+        misses = []
+        if remaining:
+            cached_values = await get_many_from_redis(remaining)
+            for entered_id, cached_data in zip(remaining, cached_values):
+                if cached_data == MISSING_MARKER:
+                    not_found.append(entered_id)
+                elif not cached_data:
+                    misses.append(entered_id)
+                elif cache_raw_responses:
+                    local_cache.set(entered_id, cached_data)
+                    resolved.append(cached_data)
+                else:
+                    data = decode_cached(entered_id, cached_data)
+                    if data is None:
+                        misses.append(entered_id)
+                    else:
+                        local_cache.set(entered_id, data)
+                        resolved.append(data)
+            CACHE_LOOKUPS.labels(layer='redis', result='miss').inc(len(misses))
+            CACHE_LOOKUPS.labels(layer='redis', result='hit').inc(len(remaining) - len(misses))
+
+        span.set_attribute("batch.misses", len(misses))
+        correlation_id = None
+        items = await fetch_many_directly(misses) if misses else None
+        if misses and items is None:
+            context = trace.set_span_in_context(span)
+            correlation_id = await send_message_to_kafka('MGET', misses[0], {'ids': misses}, context=context)
+
+    return StreamingResponse(
+        stream_batch(resolved, not_found, misses, correlation_id, items), media_type='application/x-ndjson')
+
 @app.put("/myapi/{entered_id}", response_model=Item)
 async def put_item(entered_id: int, item: BaseItem):
-    logger.info(f"Received PUT request for ID {entered_id}")
+    logger.info("Received PUT request for ID %s", entered_id)
     data = item.dict()
     data['id'] = entered_id  # Add ID to the data
     with tracer.start_as_current_span("put_request") as span:
-        logger.info(f"Span context: Trace ID: {span.get_span_context().trace_id}, Span ID: {span.get_span_context().span_id}")
         context = trace.set_span_in_context(span)
-        send_message_to_kafka('PUT', entered_id, data, context=context)
-        result = get_result_from_kafka(entered_id)
+        correlation_id = await send_message_to_kafka('PUT', entered_id, data, context=context)
+        result = None
+        try:
+            result = await get_result_from_kafka(correlation_id)
+        finally:
+            # Write-through on success; evict when the outcome is unknown or failed
+            await update_cache_after_write(entered_id, result if result and 'error' not in result else None)
 
     if result:
         if 'error' in result:
@@ -275,14 +1094,18 @@ async def put_item(entered_id: int, item: BaseItem):
 
 @app.patch("/myapi/{entered_id}", response_model=Item)
 async def patch_item(entered_id: int, item: BaseItem):
-    logger.info(f"Received PATCH request for ID {entered_id}")
+    logger.info("Received PATCH request for ID %s", entered_id)
     data = {key: value for key, value in item.dict().items() if value is not None}
     data['id'] = entered_id  # Add ID to the data
     with tracer.start_as_current_span("patch_request") as span:
-        logger.info(f"Span context: Trace ID: {span.get_span_context().trace_id}, Span ID: {span.get_span_context().span_id}")
         context = trace.set_span_in_context(span)
-        send_message_to_kafka('PATCH', entered_id, data, context=context)
-        result = get_result_from_kafka(entered_id)
+        correlation_id = await send_message_to_kafka('PATCH', entered_id, data, context=context)
+        result = None
+        try:
+            result = await get_result_from_kafka(correlation_id)
+        finally:
+            # Write-through on success; evict when the outcome is unknown or failed
+            await update_cache_after_write(entered_id, result if result and 'error' not in result else None)
 
     if result:
         if 'error' in result:
@@ -292,41 +1115,109 @@ async def patch_item(entered_id: int, item: BaseItem):
 
 @app.delete("/myapi/{entered_id}", status_code=204)
 async def delete_item(entered_id: int):
-    logger.info(f"Received DELETE request for ID {entered_id}")
+    logger.info("Received DELETE request for ID %s", entered_id)
     with tracer.start_as_current_span("delete_request") as span:
-        logger.info(f"Span context: Trace ID: {span.get_span_context().trace_id}, Span ID: {span.get_span_context().span_id}")
         context = trace.set_span_in_context(span)
-        send_message_to_kafka('DELETE', entered_id, None, context=context)
-        result = get_result_from_kafka(entered_id)
+        correlation_id = await send_message_to_kafka('DELETE', entered_id, None, context=context)
+        replied = False
+        try:
+            result = await get_result_from_kafka(correlation_id)
+            replied = True
+        finally:
+            await update_cache_after_write(entered_id, None, deleted=replied)
 
     if result is not None:
-        return JSONResponse(status_code=204)
+        return Response(status_code=204)
     raise HTTPException(status_code=404, detail=f"Could not find data with ID {entered_id}")
 
-def run_health_checks():
-    logger.info("Starting health checks...")
-    redis_status = check_redis()
-    kafka_status = check_kafka()
+@app.get("/internal/kafka/producer-metrics")
+async def kafka_producer_metrics():
+    if producer is None:
+        raise HTTPException(status_code=503, detail="Not connected to Kafka yet")
+    return producer_metrics_summary(producer)
 
-    if redis_status:
-        logger.info("Redis health check passed.")
-    else:
-        logger.error("Redis health check failed.")
+@app.get("/healthz")
+async def healthz():
+    # Liveness: answering at all means the event loop is running
+    return {'status': 'ok'}
 
-    if kafka_status:
-        logger.info("Kafka health check passed.")
-    else:
-        logger.error("Kafka health check failed")
+@app.get("/readyz")
+async def readyz():
+    """Readiness with per-dependency status; checks older than the interval are refreshed."""
+    checks = []
+    if not dependency_status.is_fresh('redis', HEALTH_CHECK_INTERVAL):
+        checks.append(check_redis())
+    if kafka_admin is not None and not dependency_status.is_fresh('kafka', HEALTH_CHECK_INTERVAL):
+        checks.append(check_kafka_async())
+    if checks:
+        await asyncio.gather(*checks)
+    if producer is not None:
+        dependency_status.mark('replies', reply_dispatcher.ready, None if reply_dispatcher.ready else 'reply dispatcher stopped')
+    report = dependency_status.report()
+    return JSONResponse(status_code=200 if report['status'] == 'ready' else 503, content=report)
 
-    if redis_status and kafka_status:
-        ensure_kafka_topics()
-        logger.info("Health checks passed. Starting the application.")
-    else:
-        logger.error("Health checks failed. Application not started.")
+async def connect_dependencies():
+    """Connect to Redis, Kafka and (if enabled) MongoDB in parallel, retrying each until it succeeds."""
+    async def connect_redis():
+        while not await check_redis():
+            logger.warning("Redis not reachable, retrying in %ss", DEPENDENCY_RETRY)
+            await asyncio.sleep(DEPENDENCY_RETRY)
+        logger.info("Redis connection successful.")
+
+    async def connect_kafka_with_retry():
+        while True:
+            try:
+                await asyncio.to_thread(connect_kafka)
+                logger.info("Kafka connection successful; replies on %s", reply_topic)
+                return
+            except Exception as e:
+                dependency_status.mark('kafka', False, f"{type(e).__name__}: {e}")
+                logger.warning("Kafka setup failed, retrying in %ss: %s", DEPENDENCY_RETRY, e)
+                await asyncio.sleep(DEPENDENCY_RETRY)
+
+    async def connect_direct_reads():
+        # Optional: GET misses use Kafka until this succeeds, so it does not gate readiness
+        while True:
+            try:
+                await asyncio.to_thread(direct_reader.connect)
+                logger.info("MongoDB read pool connected.")
+                return
+            except Exception as e:
+                logger.warning("MongoDB not reachable for direct reads and search, retrying in %ss: %s", DEPENDENCY_RETRY, e)
+                await asyncio.sleep(DEPENDENCY_RETRY)
+
+    connections = [connect_redis(), connect_kafka_with_retry()]
+    if direct_reader is not None:
+        connections.append(connect_direct_reads())
+    await asyncio.gather(*connections)
+
+dependency_setup = None
+
+async def startup():
+    # Return immediately: connections are made in the background and /readyz
+    # keeps the pod out of the Service until they are all up
+    global dependency_setup, invalidation_listener, access_count_flusher
+    dependency_setup = asyncio.create_task(connect_dependencies())
+    if local_cache.enabled:
+        invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    if cache_access_flush_seconds > 0:
+        access_count_flusher = asyncio.create_task(flush_access_counts())
 
-@app.on_event("startup")
-async def startup_event():
-    run_health_checks()
+async def shutdown():
+    for task in (dependency_setup, invalidation_listener, access_count_flusher):
+        if task is not None:
+            task.cancel()
+    reply_dispatcher.stop()
+    await asyncio.to_thread(delete_reply_topic)
+    if producer is not None:
+        await asyncio.to_thread(producer.flush)
+    kafka_io_executor.shutdown(wait=False)
+    if kafka_admin is not None:
+        kafka_admin.close()
+    if direct_reader is not None:
+        direct_reader.close()
+    await close_redis_clients(redis_client, redis_reader, redis_subscriber)
+    shutdown_logging()
 
 if __name__ == "__main__":
     import uvicorn
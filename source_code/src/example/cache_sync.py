@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+import redis.asyncio as redis
+from bson import json_util
+from mongoengine import connect, disconnect, get_db
+from pymongo.errors import OperationFailure, PyMongoError
+
+from codec import cache_codec
+from config import MONGO_URI
+from health import DEPENDENCY_RETRY, DependencyStatus, start_probe_server
+from logging_setup import configure_logging, shutdown_logging
+from metrics import CACHE_SYNC_EVENTS, CACHE_SYNC_LAG, CACHE_WARMED, MONGO_LATENCY, observe_latency
+from models import CAR_PROJECTION, Car, to_item
+from redis_settings import build_redis_clients, close_redis_clients
+
+# Keeps the gateway's Redis cache in step with MongoDB by tailing a change
+# stream on the car collection (which needs a replica set), so writes made
+# outside the gateway are reflected too. Cached entries (including "not found"
+# markers) are refreshed or evicted and the id is published on the gateway's
+# invalidation channel; items that are not cached are left alone. At startup
+# the most-read ids, counted by the gateway, are written to Redis.
+#   CACHE_SYNC_RESUME_TOKEN_KEY    Redis key holding the position in the change stream
+#   CACHE_SYNC_TOKEN_SAVE_SECONDS  how often the position is saved; events since then are replayed after a restart
+#   CACHE_WARM_TOP_N               most-read ids to warm at startup (0 disables)
+#   CACHE_WARM_BATCH_SIZE          ids per MongoDB query while warming
+#   CACHE_ACCESS_COUNTER_KEY       sorted set of read counts kept by the gateway
+#   CACHE_ACCESS_MAX_IDS           ids kept in that set; the least read are trimmed
+#   CACHE_ACCESS_DECAY_SECONDS     halve every count this often so old favourites fade (0 disables)
+# CACHE_CODEC, CACHE_TTL_SECONDS, CACHE_TTL_JITTER and CACHE_INVALIDATION_CHANNEL
+# must match the gateway's.
+configure_logging()
+logger = logging.getLogger(__name__)
+
+resume_token_key = os.getenv('CACHE_SYNC_RESUME_TOKEN_KEY', 'cache_sync:resume_token')
+token_save_seconds = float(os.getenv('CACHE_SYNC_TOKEN_SAVE_SECONDS', '1'))
+warm_top_n = int(os.getenv('CACHE_WARM_TOP_N', '1000'))
+warm_batch_size = int(os.getenv('CACHE_WARM_BATCH_SIZE', '500'))
+access_counter_key = os.getenv('CACHE_ACCESS_COUNTER_KEY', 'cache:access_counts')
+access_max_ids = int(os.getenv('CACHE_ACCESS_MAX_IDS', '100000'))
+access_decay_seconds = float(os.getenv('CACHE_ACCESS_DECAY_SECONDS', '3600'))
+access_maintenance_interval = 60
+
+cache_ttl = int(os.getenv('CACHE_TTL_SECONDS', '300'))
+cache_ttl_jitter = float(os.getenv('CACHE_TTL_JITTER', '0.1'))
+cache_invalidation_channel = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+
+metrics_port = int(os.getenv('METRICS_PORT', '8000'))
+liveness_timeout = float(os.getenv('LIVENESS_TIMEOUT_SECONDS', '60'))
+dependency_status = DependencyStatus('mongo', 'redis')
+
+# ChangeStreamHistoryLost, ChangeStreamFatalError and the pre-4.2 equivalent:
+# the saved position has left the oplog and cannot be resumed from
+HISTORY_LOST_CODES = {260, 280, 286}
+
+redis_client, _, _ = build_redis_clients()
+
+
+def cache_ttl_with_jitter():
+    return max(1, int(cache_ttl * (1 + random.uniform(-cache_ttl_jitter, cache_ttl_jitter))))
+
+
+def connect_mongo():
+    disconnect(alias='default')
+    connect(host=MONGO_URI)
+    get_db().command('ping')
+    dependency_status.mark('mongo', True)
+    return Car._get_collection()
+
+
+async def load_resume_token():
+    raw = await redis_client.get(resume_token_key)
+    return json_util.loads(raw) if raw else None
+
+
+async def save_resume_token(token):
+    if token is None:
+        await redis_client.delete(resume_token_key)
+    else:
+        await redis_client.set(resume_token_key, json_util.dumps(token))
+
+
+async def apply_change(change):
+    """Refresh or evict the cache entry for one change event."""
+    entered_id = (change.get('documentKey') or {}).get('_id')
+    operation = change['operationType']
+    if entered_id is None or operation not in ('insert', 'update', 'replace', 'delete'):
+        return
+    document = change.get('fullDocument')
+    if document is not None:
+        item = to_item({key: document[key] for key in CAR_PROJECTION if key in document})
+        # Only entries that are already cached: the change stream must not fill Redis with cold items
+        await redis_client.set(entered_id, cache_codec.encode(item), ex=cache_ttl_with_jitter(), xx=True)
+        action = 'refreshed'
+    else:
+        # A delete, or a document already deleted again when the update was looked up
+        await redis_client.delete(entered_id)
+        action = 'evicted'
+    await redis_client.publish(cache_invalidation_channel, str(entered_id))
+    CACHE_SYNC_EVENTS.labels(action=action).inc()
+    if change.get('clusterTime') is not None:
+        CACHE_SYNC_LAG.set(max(0.0, time.time() - change['clusterTime'].time))
+
+
+def find_documents(collection, ids):
+    with observe_latency(MONGO_LATENCY, operation='warm_find'):
+        return list(collection.find({'_id': {'$in': ids}}, CAR_PROJECTION))
+
+
+async def warm_cache(collection, overwrite=False):
+    """Write the most-read ids to Redis; existing entries are kept unless overwrite is set."""
+    if warm_top_n <= 0:
+        return
+    ids = [int(entered_id) for entered_id in await redis_client.zrevrange(access_counter_key, 0, warm_top_n - 1)]
+    warmed = 0
+    for start in range(0, len(ids), warm_batch_size):
+        documents = await asyncio.to_thread(find_documents, collection, ids[start:start + warm_batch_size])
+        pipeline = redis_client.pipeline(transaction=False)
+        for document in documents:
+            item = to_item(document)
+            pipeline.set(item['id'], cache_codec.encode(item), ex=cache_ttl_with_jitter(), nx=not overwrite)
+        await pipeline.execute()
+        warmed += len(documents)
+        dependency_status.heartbeat()
+    CACHE_WARMED.inc(warmed)
+    logger.info("Warmed the cache with %d of the %d most-read IDs", warmed, len(ids))
+
+
+def open_change_stream(collection, token):
+    return collection.watch(full_document='updateLookup', resume_after=token, max_await_time_ms=1000)
+
+
+async def sync_changes(collection):
+    """Apply change events to Redis until cancelled, reopening the stream after errors.
+
+    The stream is opened before warming, so writes that race with the warming
+    reads are applied afterwards. The in-memory position only advances past
+    events that were applied, so a failed event is retried when the stream is
+    reopened.
+    """
+    token, warm_pending, overwrite = None, True, False
+    while True:
+        try:
+            if token is None:
+                token = await load_resume_token()
+                logger.info("Change stream %s", "resuming from the saved position" if token else "starting from now")
+            try:
+                stream = await asyncio.to_thread(open_change_stream, collection, token)
+            except OperationFailure as e:
+                if token is None or e.code not in HISTORY_LOST_CODES:
+                    raise
+                # Events were missed: start from now and refresh the hot entries
+                logger.warning("Saved change stream position is no longer in the oplog; starting from now: %s", e)
+                token, warm_pending, overwrite = None, True, True
+                await save_resume_token(None)
+                stream = await asyncio.to_thread(open_change_stream, collection, None)
+            dependency_status.mark('mongo', True)
+            try:
+                if warm_pending:
+                    await warm_cache(collection, overwrite)
+                    warm_pending = False
+                dependency_status.mark('redis', True)
+                saved_at = time.monotonic()
+                while stream.alive:
+                    change = await asyncio.to_thread(stream.try_next)
+                    dependency_status.heartbeat()
+                    if change is not None:
+                        await apply_change(change)
+                    token = stream.resume_token
+                    if token is not None and time.monotonic() - saved_at >= token_save_seconds:
+                        await save_resume_token(token)
+                        saved_at = time.monotonic()
+            finally:
+                await asyncio.to_thread(stream.close)
+            # The stream was invalidated (collection dropped or renamed): start over
+            logger.warning("Change stream invalidated; restarting from now")
+            token, warm_pending, overwrite = None, True, True
+            await save_resume_token(None)
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            dependency_status.mark('mongo', False, f"{type(e).__name__}: {e}")
+            logger.warning("Change stream failed, reopening in %ss: %s", DEPENDENCY_RETRY, e)
+        except redis.RedisError as e:
+            dependency_status.mark('redis', False, f"{type(e).__name__}: {e}")
+            logger.warning("Redis unavailable, reopening the change stream in %ss: %s", DEPENDENCY_RETRY, e)
+        dependency_status.heartbeat()
+        await asyncio.sleep(DEPENDENCY_RETRY)
+
+
+async def maintain_access_counts():
+    """Trim the access counter to its most-read ids and periodically halve every count."""
+    next_decay = time.monotonic() + access_decay_seconds
+    while True:
+        await asyncio.sleep(access_maintenance_interval)
+        try:
+            await redis_client.zremrangebyrank(access_counter_key, 0, -access_max_ids - 1)
+            if access_decay_seconds > 0 and time.monotonic() >= next_decay:
+                await redis_client.zunionstore(access_counter_key, {access_counter_key: 0.5})
+                next_decay = time.monotonic() + access_decay_seconds
+        except redis.RedisError as e:
+            logger.warning("Could not maintain the access counter: %s", e)
+
+
+async def main():
+    while True:
+        try:
+            collection = await asyncio.to_thread(connect_mongo)
+            break
+        except Exception as e:
+            dependency_status.mark('mongo', False, f"{type(e).__name__}: {e}")
+            logger.warning("MongoDB not reachable, retrying in %ss: %s", DEPENDENCY_RETRY, e)
+            dependency_status.heartbeat()
+            await asyncio.sleep(DEPENDENCY_RETRY)
+    try:
+        await asyncio.gather(sync_changes(collection), maintain_access_counts())
+    finally:
+        await close_redis_clients(redis_client)
+        disconnect(alias='default')
+
+
+if __name__ == "__main__":
+    start_probe_server(metrics_port, dependency_status, liveness_timeout)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Shutting down gracefully")
+    finally:
+        shutdown_logging()
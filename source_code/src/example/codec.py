@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_HEADER = 'content-type'
+
+
+class JsonCodec:
+    name = 'json'
+    content_type = 'application/json'
+    # Encoded bytes are valid JSON and can be returned to HTTP clients as-is
+    json_compatible = True
+
+    def encode(self, value):
+        return json.dumps(value).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def encode(self, value):
+        return self._orjson.dumps(value)
+
+    def decode(self, data):
+        return self._orjson.loads(data)
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+    json_compatible = False
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def encode(self, value):
+        return self._msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data):
+        return self._msgpack.unpackb(data, raw=False)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)}
+_instances = {}
+
+
+def get_codec(name):
+    """Return the codec called name, falling back to json if its library is missing."""
+    name = (name or 'json').lower()
+    if name not in _instances:
+        if name not in CODECS:
+            raise ValueError(f"Unknown codec {name!r}; expected one of {sorted(CODECS)}")
+        try:
+            _instances[name] = CODECS[name]()
+        except ImportError as e:
+            logger.warning("Codec %s unavailable (%s); using json", name, e)
+            _instances[name] = get_codec('json')
+    return _instances[name]
+
+
+def _json_decoder_name():
+    # JSON and orjson share a content type; decode it with orjson when installed
+    try:
+        import orjson  # noqa: F401
+        return 'orjson'
+    except ImportError:
+        return 'json'
+
+
+_by_content_type = {JsonCodec.content_type: _json_decoder_name(), MsgpackCodec.content_type: 'msgpack'}
+
+
+def codec_for_headers(headers):
+    """Pick the decoder from a Kafka message's content-type header (json if absent)."""
+    for key, value in headers or []:
+        if key == CONTENT_TYPE_HEADER:
+            content_type = value.decode('utf-8') if isinstance(value, bytes) else value
+            return get_codec(_by_content_type.get(content_type, 'json'))
+    return get_codec(_by_content_type[JsonCodec.content_type])
+
+
+def decode_kafka_value(value, headers):
+    return codec_for_headers(headers).decode(value)
+
+
+def content_type_header(codec):
+    return (CONTENT_TYPE_HEADER, codec.content_type.encode('utf-8'))
+
+
+# Codecs selected by configuration. Producers encode with KAFKA_CODEC and tag
+# each message with its content type; consumers decode by that tag, so services
+# running different codecs interoperate. CACHE_CODEC encodes Redis values.
+kafka_codec = get_codec(os.getenv('KAFKA_CODEC', 'json'))
+cache_codec = get_codec(os.getenv('CACHE_CODEC', 'json'))
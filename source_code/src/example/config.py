@@ -10,3 +10,8 @@ MONGO_URI = f'mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/
 
 if not all([MONGO_USER, MONGO_PASSWORD, MONGO_DB, MONGO_HOST, MONGO_PORT]):
     raise ValueError("One or more environment variables for MongoDB connection are not set.")
+
+# Kafka topic layout. Existing topics are grown to KAFKA_TOPIC_PARTITIONS at startup;
+# messages are keyed by entity id so per-id ordering survives repartitioning.
+KAFKA_TOPIC_PARTITIONS = int(os.getenv('KAFKA_TOPIC_PARTITIONS', '1'))
+KAFKA_REPLICATION_FACTOR = int(os.getenv('KAFKA_REPLICATION_FACTOR', '1'))
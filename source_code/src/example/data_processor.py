@@ -1,187 +1,521 @@
-import json
 import os
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from kafka import KafkaConsumer, KafkaProducer
-from kafka.admin import KafkaAdminClient, NewTopic
-from kafka.errors import TopicAlreadyExistsError
-from opentelemetry import trace, context
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from kafka.admin import KafkaAdminClient
+from kafka.errors import KafkaError
+from opentelemetry import trace
 from opentelemetry.instrumentation.kafka import KafkaInstrumentor
 from opentelemetry.instrumentation.pymongo import PymongoInstrumentor
-from opentelemetry.propagate import extract, inject
+from opentelemetry.propagate import extract
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from mongoengine import connect, DoesNotExist, disconnect
+from mongoengine import connect, disconnect, get_db
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from codec import content_type_header, decode_kafka_value, kafka_codec
 from config import MONGO_URI
+from dedupe import DedupeStore
+from health import DEPENDENCY_RETRY, DependencyStatus, start_probe_server
 from models import Car
+from kafka_settings import ensure_kafka_topics, producer_config, producer_metrics_summary
+from logging_setup import configure_logging, shutdown_logging
+from metrics import (
+    BATCH_SIZE, CONSUMER_LAG, DEDUPE_ENTRIES, MESSAGES_EXPIRED, MESSAGES_PROCESSED, MONGO_LATENCY, PROCESSING_RATE,
+    RECORDS_COMMITTED, REQUESTS_DEDUPLICATED, observe_latency,
+)
+from redis_settings import build_sync_redis_client
+from tracing import build_tracer_provider
 
-# Setup logging
+# Setup logging: trace/span ids are attached by a filter and records are
+# written by a background thread (see logging_setup)
+configure_logging()
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# Suppress verbose Kafka logs
-logging.getLogger('kafka').setLevel(logging.WARNING)
-logging.getLogger('kafka.consumer.fetcher').setLevel(logging.WARNING)
-logging.getLogger('kafka.protocol.parser').setLevel(logging.WARNING)
-logging.getLogger('kafka.conn').setLevel(logging.WARNING)
-
-# Custom logger function
-def custom_logger(msg, level=logging.INFO, exc_info=None):
-    span = trace.get_current_span()
-    span_context = span.get_span_context()
-    extra = {
-        'trace_id': '{:032x}'.format(span_context.trace_id) if span_context.is_valid else "N/A",
-        'span_id': '{:016x}'.format(span_context.span_id) if span_context.is_valid else "N/A"
-    }
-    if level == logging.ERROR:
-        logger.error(msg, extra=extra, exc_info=exc_info)
-    elif level == logging.WARNING:
-        logger.warning(msg, extra=extra)
-    elif level == logging.DEBUG:
-        logger.debug(msg, extra=extra)
-    else:
-        logger.info(msg, extra=extra)
 
 # OpenTelemetry Setup
 def initialize_tracer():
     if os.getenv('ENABLE_TRACING', 'true').lower() == 'true':
         otlp_endpoint = os.getenv('OTLP_ENDPOINT', 'localhost:4317')
-        resource = Resource.create({"service.name": "data_processor"})
-        provider = TracerProvider(resource=resource)
-        processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint, insecure=True))
-        provider.add_span_processor(processor)
+        provider = build_tracer_provider("data_processor", otlp_endpoint)
         trace.set_tracer_provider(provider)
 
 # Kafka Setup
 kafka_broker = os.getenv('KAFKA_BROKER', 'localhost:9092')
-topics = ['data_requests', 'data_responses']
 
-# Ensure Kafka topics exist
-def ensure_kafka_topics():
+# Batch processing: poll up to BATCH_SIZE records, waiting at most BATCH_LINGER_MS
+# for them, flush replies once per batch (or whenever MAX_IN_FLIGHT replies are
+# unacknowledged) and commit offsets only after every reply in the batch is acked.
+# A reply send blocks at most PROCESSOR_REPLY_MAX_BLOCK_MS for topic metadata,
+# so a reply to a gateway whose topic is gone does not stall a worker lane.
+batch_size = int(os.getenv('PROCESSOR_BATCH_SIZE', '100'))
+reply_max_block_ms = int(os.getenv('PROCESSOR_REPLY_MAX_BLOCK_MS', '1000'))
+batch_linger_ms = int(os.getenv('PROCESSOR_BATCH_LINGER_MS', '50'))
+max_in_flight = int(os.getenv('PROCESSOR_MAX_IN_FLIGHT', '500'))
+producer_metrics_interval = float(os.getenv('PRODUCER_METRICS_LOG_INTERVAL_SECONDS', '60'))
+
+# Prometheus metrics and the /healthz and /readyz probes are served on
+# METRICS_PORT; consumer lag and the MongoDB ping are refreshed every
+# CONSUMER_LAG_INTERVAL_SECONDS since they cost a round trip. Liveness fails
+# when the main loop has not completed an iteration for LIVENESS_TIMEOUT_SECONDS.
+metrics_port = int(os.getenv('METRICS_PORT', '8000'))
+consumer_lag_interval = float(os.getenv('CONSUMER_LAG_INTERVAL_SECONDS', '15'))
+liveness_timeout = float(os.getenv('LIVENESS_TIMEOUT_SECONDS', '60'))
+dependency_status = DependencyStatus('kafka', 'mongo')
+
+# Worker lanes: messages are hashed by id onto PROCESSOR_WORKERS single-threaded
+# lanes, so different ids are processed in parallel while each id stays ordered.
+worker_count = max(1, int(os.getenv('PROCESSOR_WORKERS', '4')))
+worker_lanes = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'lane-{i}') for i in range(worker_count)]
+
+# Idempotency: a request's correlation_id is unique per gateway request (and
+# kept across the gateway's send retries), so it serves as the request id.
+# Requests whose reply was acked are remembered in an LRU of DEDUPE_MAX_ENTRIES
+# ids (0 disables); with DEDUPE_REDIS_ENABLED they are also kept in Redis for
+# DEDUPE_TTL_SECONDS, which survives restarts and rebalances. A redelivered
+# write gets its original reply again and a redelivered read is skipped, so
+# replays never repeat MongoDB work.
+dedupe_store = DedupeStore(
+    max_entries=int(os.getenv('DEDUPE_MAX_ENTRIES', '100000')),
+    ttl_seconds=int(os.getenv('DEDUPE_TTL_SECONDS', '3600')),
+)
+dedupe_redis_enabled = os.getenv('DEDUPE_REDIS_ENABLED', 'false').lower() == 'true'
+DEDUPE_ENTRIES.set_function(lambda: len(dedupe_store))
+
+# Connections are made by setup() when the service starts, not at import
+producer = None
+consumer = None
+
+def connect_kafka():
+    global producer, consumer
     admin_client = KafkaAdminClient(bootstrap_servers=kafka_broker)
-    existing_topics = admin_client.list_topics()
-    for topic in topics:
-        if topic not in existing_topics:
+    try:
+        ensure_kafka_topics(admin_client)
+    finally:
+        admin_client.close()
+    if producer is None:
+        producer = KafkaProducer(bootstrap_servers=kafka_broker, key_serializer=lambda k: str(k).encode('utf-8'), value_serializer=kafka_codec.encode,
+                                 max_block_ms=reply_max_block_ms, **producer_config())
+    if consumer is None:
+        consumer = KafkaConsumer('data_requests', bootstrap_servers=kafka_broker, auto_offset_reset='earliest', enable_auto_commit=False, group_id='data_processor_group', max_poll_records=batch_size)
+    dependency_status.mark('kafka', True)
+
+def connect_mongo():
+    disconnect(alias='default')
+    connect(host=MONGO_URI)
+    get_db().command('ping')
+    # Indexes for the gateway's searches; a no-op once they exist
+    Car.ensure_indexes()
+    dependency_status.mark('mongo', True)
+
+def check_mongo():
+    try:
+        get_db().command('ping')
+        dependency_status.mark('mongo', True)
+        return True
+    except Exception as e:
+        dependency_status.mark('mongo', False, f"{type(e).__name__}: {e}")
+        return False
+
+def setup():
+    """Connect to Kafka and MongoDB in parallel, retrying each until it succeeds."""
+    KafkaInstrumentor().instrument()
+    PymongoInstrumentor().instrument()
+
+    def with_retry(name, connect_fn):
+        while True:
             try:
-                admin_client.create_topics([NewTopic(name=topic, num_partitions=1, replication_factor=1)])
-                custom_logger(f"Created Kafka topic: {topic}")
-            except TopicAlreadyExistsError:
-                custom_logger(f"Kafka topic {topic} already exists")
+                connect_fn()
+                logger.info("Connected to %s", name)
+                return
+            except Exception as e:
+                dependency_status.mark(name, False, f"{type(e).__name__}: {e}")
+                logger.warning("%s not reachable, retrying in %ss: %s", name, DEPENDENCY_RETRY, e)
+            dependency_status.heartbeat()
+            time.sleep(DEPENDENCY_RETRY)
 
-ensure_kafka_topics()
+    if dedupe_redis_enabled:
+        # While Redis is unreachable the store works from memory alone
+        try:
+            dedupe_store.redis_client = build_sync_redis_client()
+        except Exception as e:
+            logger.warning("Dedupe store running without Redis: %s", e)
 
-KafkaInstrumentor().instrument()
-PymongoInstrumentor().instrument()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='setup') as pool:
+        for future in [pool.submit(with_retry, 'kafka', connect_kafka), pool.submit(with_retry, 'mongo', connect_mongo)]:
+            future.result()
 
-producer = KafkaProducer(bootstrap_servers=kafka_broker, value_serializer=lambda v: json.dumps(v).encode('utf-8'))
-consumer = KafkaConsumer('data_requests', bootstrap_servers=kafka_broker, auto_offset_reset='earliest', enable_auto_commit=False, group_id='data_processor_group', value_deserializer=lambda v: json.loads(v.decode('utf-8')))
+# Message processing: requests are resolved in groups so a batch costs a handful
+# of MongoDB round trips instead of one or two per message.
+WRITE_TYPES = ('PUT', 'PATCH', 'DELETE')
 
-# MongoDB connection
-disconnect(alias='default')
-connect(host=MONGO_URI)
+def message_ids(message):
+    """Ids a message touches: its own id, or every requested id for an MGET."""
+    if message['type'] == 'MGET':
+        return message['data']['ids']
+    return [message['id']]
 
-# Process message function
-def process_message(message, headers):
-    try:
+def split_segments(messages):
+    """Split messages into segments that can each be served by one bulk round trip.
+
+    Within a segment an id touched by a write appears only once, so reads and
+    writes in the segment commute and can be executed as grouped operations
+    while keeping per-id ordering.
+    """
+    segments = []
+    current, touched = [], {}
+    for index, message in enumerate(messages):
+        is_write = message['type'] in WRITE_TYPES
+        ids = message_ids(message)
+        if any(touched.get(i) is not None and (is_write or touched[i]) for i in ids):
+            segments.append(current)
+            current, touched = [], {}
+        current.append(index)
+        for i in ids:
+            touched[i] = touched.get(i, False) or is_write
+    if current:
+        segments.append(current)
+    return segments
+
+def find_by_ids(collection, ids, operation='find'):
+    if not ids:
+        return {}
+    with observe_latency(MONGO_LATENCY, operation=operation):
+        return {doc['_id']: doc for doc in collection.find({'_id': {'$in': list(ids)}})}
+
+def execute_segment(collection, messages, indexes, results):
+    """Run one segment: a single $in read, a single bulk_write and a $in read-back for PATCH."""
+    prefetch_ids = {
+        message_id for i in indexes if messages[i]['type'] in ('GET', 'MGET', 'DELETE')
+        for message_id in message_ids(messages[i])
+    }
+    existing = find_by_ids(collection, prefetch_ids)
+
+    ops, op_indexes = [], []
+    for i in indexes:
+        message = messages[i]
+        try:
+            if message['type'] == 'PUT':
+                car = Car(**message['data'])
+                car.validate()
+                document = car.to_mongo().to_dict()
+                ops.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+                results[i] = document
+            elif message['type'] == 'PATCH':
+                fields = {key: value for key, value in message['data'].items() if key != 'id'}
+                Car(id=message['id'], **fields).validate()
+                ops.append(UpdateOne({'_id': message['id']}, {'$set': fields}))
+            elif message['type'] == 'DELETE':
+                if message['id'] not in existing:
+                    continue
+                ops.append(DeleteOne({'_id': message['id']}))
+                results[i] = {'status': 'deleted'}
+            else:
+                continue
+            op_indexes.append(i)
+        except Exception as e:
+            logger.error("Invalid %s request for ID %s: %s", message['type'], message['id'], e)
+
+    if ops:
+        try:
+            with observe_latency(MONGO_LATENCY, operation='bulk_write'):
+                collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                i = op_indexes[error['index']]
+                results[i] = None
+                logger.error("Error during %s for ID %s: %s", messages[i]['type'], messages[i]['id'], error.get('errmsg'))
+
+    patched_ids = {messages[i]['id'] for i in indexes if messages[i]['type'] == 'PATCH'}
+    patched = find_by_ids(collection, patched_ids, operation='patch_readback')
+    for i in indexes:
+        message = messages[i]
+        if message['type'] == 'GET':
+            results[i] = existing.get(message['id'])
+        elif message['type'] == 'MGET':
+            # Only the documents found; the gateway reports the rest as missing
+            results[i] = [existing[message_id] for message_id in message['data']['ids'] if message_id in existing]
+        elif message['type'] == 'PATCH' and i in op_indexes:
+            results[i] = patched.get(message['id'])
+
+def execute_requests(messages):
+    """Resolve a list of request messages against MongoDB with grouped operations.
+
+    Returns the reply data for each message, in order (None when not found or failed).
+    """
+    collection = Car._get_collection()
+    results = [None] * len(messages)
+    for indexes in split_segments(messages):
+        execute_segment(collection, messages, indexes, results)
+    return results
+
+def send_reply(message, data, error=None):
+    """Queue the reply for a message (not flushed) in the current span context.
+
+    error reports that the request could not be carried out, so the gateway
+    does not mistake the missing data for "not found".
+    """
+    response_message = {
+        'id': message['id'],
+        'correlation_id': message.get('correlation_id'),
+        'data': data,
+        'context': {}
+    }
+    if error is not None:
+        response_message['error'] = error
+
+    # Inject context into response
+    TraceContextTextMapPropagator().inject(response_message['context'])
+
+    # Ensure headers are in the correct format
+    kafka_headers = [(key, value.encode('utf-8')) for key, value in response_message['context'].items()]
+    kafka_headers.append(content_type_header(kafka_codec))
+    # Reply straight to the requesting gateway's advertised address
+    reply_to = message.get('reply_to') or {}
+    return producer.send(
+        reply_to.get('topic') or 'data_responses',
+        key=message['id'],
+        value=response_message,
+        headers=kafka_headers,
+        partition=reply_to.get('partition')
+    )
+
+def process_messages(items):
+    """Process (message, headers) pairs as one group and queue their replies.
+
+    Returns the send future of each reply, or None for messages whose reply
+    could not be produced.
+    """
+    tracer = trace.get_tracer(__name__)
+    spans = []
+    for message, headers in items:
         # Extract context from Kafka message headers
-        custom_logger(f"Original headers: {headers}")
         carrier = {key: value.decode('utf-8') if isinstance(value, bytes) else value for key, value in headers}
-        custom_logger(f"Carrier for context extraction: {carrier}")
-        extracted_context = extract(carrier)
-        custom_logger(f"Extracted trace context from headers: {headers}")
-
-        # Use the extracted context for the new span
-        with trace.use_span(trace.get_current_span(), end_on_exit=True):
-            with trace.get_tracer(__name__).start_as_current_span(f"process_{message['type']}_request", context=extracted_context):
-                custom_logger(f"Started span for processing request: {message['type']} with ID {message['id']}")
-
-                data = None
-
-                # MongoDB operations
-                with trace.get_tracer(__name__).start_as_current_span("mongodb_operation") as mongo_span:
-                    custom_logger(f"Current MongoDB operation span: Trace ID: {mongo_span.get_span_context().trace_id}, Span ID: {mongo_span.get_span_context().span_id}")
-                    mongo_span.set_attribute("db.system", "mongodb")
-                    mongo_span.set_attribute("db.name", "testapp")
-
-                    if message["type"] == "GET":
-                        try:
-                            custom_logger(f"Attempting to GET document with ID: {message['id']}")
-                            result = Car.objects.get(id=message["id"])
-                            data = result.to_mongo().to_dict()
-                            custom_logger(f"Data for GET request: {data}")
-                        except DoesNotExist:
-                            custom_logger(f"No data found for ID {message['id']}")
-
-                    elif message["type"] == "PUT":
-                        try:
-                            custom_logger(f"Attempting to PUT document with data: {message['data']}")
-                            new_car = Car(**message["data"])
-                            new_car.save()
-                            data = new_car.to_mongo().to_dict()
-                            custom_logger(f"Data for PUT request: {data}")
-                        except Exception as e:
-                            custom_logger(f"Error during PUT operation: {e}", level=logging.ERROR)
-
-                    elif message["type"] == "PATCH":
-                        try:
-                            custom_logger(f"Attempting to PATCH document with ID: {message['id']} and data: {message['data']}")
-                            car = Car.objects.get(id=message["id"])
-                            for key, value in message["data"].items():
-                                setattr(car, key, value)
-                            car.save()
-                            data = car.to_mongo().to_dict()
-                            custom_logger(f"Data for PATCH request: {data}")
-                        except DoesNotExist:
-                            custom_logger(f"No data found for ID {message['id']}")
-                        except Exception as e:
-                            custom_logger(f"Error during PATCH operation: {e}", level=logging.ERROR)
-
-                    elif message["type"] == "DELETE":
-                        try:
-                            custom_logger(f"Attempting to DELETE document with ID: {message['id']}")
-                            car = Car.objects.get(id=message["id"])
-                            car.delete()
-                            data = {'status': 'deleted'}
-                            custom_logger(f"DELETE request processed for ID {message['id']}")
-                        except DoesNotExist:
-                            custom_logger(f"No data found for ID {message['id']}")
-                        except Exception as e:
-                            custom_logger(f"Error during DELETE operation: {e}", level=logging.ERROR)
-
-                response_message = {
-                    'id': message['id'],
-                    'data': data,
-                    'context': {}
-                }
-
-                # Inject context into response
-                TraceContextTextMapPropagator().inject(response_message['context'])
-                custom_logger(f"Carrier after context injection: {response_message['context']}")
-
-                # Ensure headers are in the correct format
-                kafka_headers = [(key, value.encode('utf-8')) for key, value in response_message['context'].items()]
-                producer.send('data_responses', value=response_message, headers=kafka_headers)
-                producer.flush()
-                custom_logger("Response message sent to Kafka")
-    except Exception as e:
-        custom_logger(f"Error processing message: {e}", level=logging.ERROR, exc_info=True)
+        spans.append(tracer.start_span(f"process_{message['type']}_request", context=extract(carrier)))
+
+    messages = [message for message, _ in items]
+    links = [trace.Link(span.get_span_context()) for span in spans]
+    with tracer.start_as_current_span("mongodb_operation", links=links) as mongo_span:
+        mongo_span.set_attribute("db.system", "mongodb")
+        mongo_span.set_attribute("db.name", "testapp")
+        mongo_span.set_attribute("db.batch_size", len(messages))
+        error = None
+        try:
+            results = execute_requests(messages)
+        except Exception as e:
+            logger.error("Error during MongoDB operations: %s", e, exc_info=True)
+            dependency_status.mark('mongo', False, f"{type(e).__name__}: {e}")
+            mongo_span.record_exception(e)
+            results = [None] * len(messages)
+            error = f"database error: {type(e).__name__}"
+
+    futures = []
+    for message, data, span in zip(messages, results, spans):
+        with trace.use_span(span, end_on_exit=True):
+            try:
+                future = send_reply(message, data, error)
+                if error is None:
+                    remember_completed(message, data, future)
+                futures.append(future)
+                logger.debug("Processed %s request for ID %s", message['type'], message['id'])
+            except Exception as e:
+                logger.error("Error processing message: %s", e, exc_info=True)
+                futures.append(None)
+    return futures
+
+def remember_completed(message, data, future):
+    """Record the request in the dedupe store once its reply is acked."""
+    request_id = message.get('correlation_id')
+    if request_id is None or not dedupe_store.enabled:
+        return
+    entry = {'replay': True, 'data': data} if message['type'] in WRITE_TYPES else {'replay': False}
+    future.add_callback(lambda _: dedupe_store.put(request_id, entry))
+
+def skip_completed(items):
+    """Split off redelivered requests; returns (items still to process, futures of re-sent replies)."""
+    if not dedupe_store.enabled:
+        return items, []
+    completed = dedupe_store.get_many([message['correlation_id'] for message, _ in items if message.get('correlation_id')])
+    fresh, futures, seen = [], [], set()
+    for message, headers in items:
+        request_id = message.get('correlation_id')
+        if request_id is None:
+            fresh.append((message, headers))
+            continue
+        if request_id in seen:
+            # The same request twice in one batch (a gateway send retry): the first copy answers it
+            REQUESTS_DEDUPLICATED.labels(tier='batch').inc()
+            continue
+        seen.add(request_id)
+        if request_id not in completed:
+            fresh.append((message, headers))
+            continue
+        entry, tier = completed[request_id]
+        REQUESTS_DEDUPLICATED.labels(tier=tier).inc()
+        logger.debug("Skipping redelivered %s request %s for ID %s", message['type'], request_id, message['id'])
+        if entry['replay']:
+            try:
+                futures.append(send_reply(message, entry['data']))
+            except Exception as e:
+                logger.error("Could not re-send the reply for request %s: %s", request_id, e)
+    return fresh, futures
+
+def flush_replies(futures):
+    """Flush queued replies and report whether every one of them was acked."""
+    producer.flush()
+    failed = [future for future in futures if future.failed()]
+    for future in failed:
+        logger.error("Failed to deliver reply: %s", future.exception)
+    return not failed
+
+def poll_batch():
+    """Collect up to batch_size records, lingering at most batch_linger_ms."""
+    batch = {}
+    count = 0
+    deadline = time.monotonic() + batch_linger_ms / 1000.0
+    while count < batch_size:
+        remaining_ms = max(0, int((deadline - time.monotonic()) * 1000))
+        records = consumer.poll(timeout_ms=remaining_ms, max_records=batch_size - count)
+        for tp, messages in records.items():
+            batch.setdefault(tp, []).extend(messages)
+            count += len(messages)
+        if remaining_ms == 0:
+            break
+    return batch
+
+def lane_for(message_id):
+    return hash(message_id) % worker_count
+
+def process_in_lanes(items):
+    """Fan items out to worker lanes by id and wait for every lane to finish."""
+    if worker_count == 1:
+        return process_messages(items)
+    lanes = [[] for _ in range(worker_count)]
+    for item in items:
+        lanes[lane_for(item[0]['id'])].append(item)
+    submitted = [worker_lanes[i].submit(process_messages, lane) for i, lane in enumerate(lanes) if lane]
+    return [future for lane_result in submitted for future in lane_result.result()]
+
+def drop_expired(items):
+    """Drop requests whose gateway deadline has passed: nobody is waiting for the reply.
+
+    The deadline is wall-clock time set by the gateway, so this relies on the
+    pods' clocks being roughly in sync (NTP).
+    """
+    now = time.time()
+    live = []
+    for message, headers in items:
+        deadline = message.get('deadline')
+        if deadline is not None and deadline < now:
+            MESSAGES_EXPIRED.labels(type=message.get('type', 'unknown')).inc()
+            logger.debug("Dropping expired %s request for ID %s", message.get('type'), message.get('id'))
+            continue
+        live.append((message, headers))
+    return live
+
+def process_batch(records):
+    """Process one poll() worth of records and commit their offsets.
+
+    Offsets are committed only once every message in the batch is done and all
+    its replies are acked, so no offset is committed ahead of an unfinished
+    earlier message. On a delivery failure each partition is rewound to the
+    first offset of the batch so the records are redelivered (at-least-once).
+    """
+    first_offsets = {tp: messages[0].offset for tp, messages in records.items()}
+    items = []
+    for messages in records.values():
+        for msg in messages:
+            try:
+                items.append((decode_kafka_value(msg.value, msg.headers), msg.headers))
+            except Exception as e:
+                # Poison record: skip it rather than block the partition
+                logger.error("Skipping undecodable message at %s:%s offset %s: %s", msg.topic, msg.partition, msg.offset, e)
+    items = drop_expired(items)
+    items, replayed = skip_completed(items)
+    BATCH_SIZE.observe(len(items))
+    for message, _ in items:
+        MESSAGES_PROCESSED.labels(type=message.get('type', 'unknown')).inc()
+    delivered = flush_replies(replayed) if replayed else True
+    for start in range(0, len(items), max_in_flight):
+        futures = process_in_lanes(items[start:start + max_in_flight])
+        delivered = flush_replies([future for future in futures if future is not None]) and delivered
+
+    # Entries of acked replies, written before the commit so a replay after it finds them
+    dedupe_store.flush()
+    if not delivered:
+        for tp, offset in first_offsets.items():
+            consumer.seek(tp, offset)
+        logger.warning("Batch not fully delivered; rewound to redeliver it")
+        return 0
+
+    consumer.commit()
+    for tp, messages in records.items():
+        committed_counts[tp] = committed_counts.get(tp, 0) + len(messages)
+        RECORDS_COMMITTED.labels(topic=tp.topic, partition=str(tp.partition)).inc(len(messages))
+    count = sum(len(messages) for messages in records.values())
+    logger.debug("Processed and committed batch of %d messages", count)
+    return count
+
+# Per-partition lag and processing rate are the autoscaling signal: summed
+# over all replicas they give the group's backlog and throughput. Each replica
+# reports only the partitions it is assigned, and drops them once revoked so
+# the sum never counts a partition twice.
+committed_counts = {}
+rate_window = {'counts': {}, 'at': time.monotonic()}
+reported_partitions = set()
+
+def update_consumer_lag():
+    global reported_partitions
+    assignment = set(consumer.assignment())
+    for tp in reported_partitions - assignment:
+        CONSUMER_LAG.remove(tp.topic, str(tp.partition))
+        PROCESSING_RATE.remove(tp.topic, str(tp.partition))
+    reported_partitions = assignment
+
+    now = time.monotonic()
+    elapsed = max(now - rate_window['at'], 1e-3)
+    previous = rate_window['counts']
+    rate_window['counts'], rate_window['at'] = dict(committed_counts), now
+    if not assignment:
+        return
+    end_offsets = consumer.end_offsets(list(assignment))
+    for tp in assignment:
+        labels = {'topic': tp.topic, 'partition': str(tp.partition)}
+        CONSUMER_LAG.labels(**labels).set(max(0, end_offsets.get(tp, 0) - consumer.position(tp)))
+        PROCESSING_RATE.labels(**labels).set((committed_counts.get(tp, 0) - previous.get(tp, 0)) / elapsed)
 
 # Main loop to consume Kafka messages
 if __name__ == "__main__":
     initialize_tracer()
+    start_probe_server(metrics_port, dependency_status, liveness_timeout)
     try:
-        custom_logger("Starting to consume messages from Kafka")
+        setup()
+        logger.info("Starting to consume messages from Kafka (batch size %d, linger %dms)", batch_size, batch_linger_ms)
+        next_metrics_log = time.monotonic() + producer_metrics_interval
+        next_lag_update = time.monotonic()
         while True:
-            for msg in consumer:
-                process_message(msg.value, msg.headers)
-                consumer.commit()
-                custom_logger(f"Processed and committed message for ID {msg.value['id']}")
+            records = poll_batch()
+            if records:
+                process_batch(records)
+            dependency_status.heartbeat()
+            if time.monotonic() >= next_lag_update:
+                try:
+                    update_consumer_lag()
+                except KafkaError as e:
+                    # Only the lag metrics are stale; keep consuming
+                    logger.warning("Could not update consumer lag: %s", e)
+                check_mongo()
+                next_lag_update = time.monotonic() + consumer_lag_interval
+            if producer_metrics_interval > 0 and time.monotonic() >= next_metrics_log:
+                logger.info("Producer metrics: %s", producer_metrics_summary(producer))
+                next_metrics_log = time.monotonic() + producer_metrics_interval
     except KeyboardInterrupt:
-        custom_logger("Shutting down gracefully")
+        logger.info("Shutting down gracefully")
     except Exception as e:
-        custom_logger(f"Unexpected error: {e}", level=logging.ERROR, exc_info=True)
+        logger.error("Unexpected error: %s", e, exc_info=True)
     finally:
-        producer.close()
-        disconnect(alias='default')
\ No newline at end of file
+        for lane in worker_lanes:
+            lane.shutdown(wait=True)
+        if producer is not None:
+            producer.close()
+        disconnect(alias='default')
+        shutdown_logging()
\ No newline at end of file
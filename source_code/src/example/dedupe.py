@@ -0,0 +1,103 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from codec import get_codec
+from redis_settings import REDIS_MODE
+
+logger = logging.getLogger(__name__)
+
+# Entries are small and only ever read back by the processor, so they are
+# always stored as JSON whatever codec the services use on the wire
+_codec = get_codec('json')
+
+
+class DedupeStore:
+    """Outcomes of recently completed requests, keyed by request id.
+
+    Kafka redelivers records after a crash or rebalance, because offsets are
+    committed only after processing. An id found here was already executed
+    and answered, so its record can be skipped (or its reply re-sent) instead
+    of running the MongoDB operation again.
+
+    Entries live in an in-process LRU of at most max_entries ids, held as
+    encoded bytes. With a redis_client they are also written there with a
+    TTL, so a replica that takes over a partition after a rebalance sees the
+    ids its previous owner completed. Redis writes are queued by put() and
+    sent in one pipeline by flush(); Redis errors degrade to memory only.
+    """
+
+    def __init__(self, max_entries, redis_client=None, ttl_seconds=3600, key_prefix='dedupe:'):
+        self.max_entries = max_entries
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get_many(self, request_ids):
+        """Return {request_id: (entry, tier)} for the ids already completed."""
+        found, missing = {}, []
+        with self._lock:
+            for request_id in request_ids:
+                encoded = self._entries.get(request_id)
+                if encoded is None:
+                    missing.append(request_id)
+                else:
+                    self._entries.move_to_end(request_id)
+                    found[request_id] = (_codec.decode(encoded), 'memory')
+        if missing and self.redis_client is not None:
+            keys = [self.key_prefix + request_id for request_id in missing]
+            try:
+                if REDIS_MODE == 'cluster':
+                    # Keys hash to different slots, so the cluster client splits the read per node
+                    values = self.redis_client.mget_nonatomic(keys)
+                else:
+                    values = self.redis_client.mget(keys)
+            except Exception as e:
+                logger.warning("Dedupe lookup in Redis failed for %d ids: %s", len(missing), e)
+                return found
+            for request_id, encoded in zip(missing, values):
+                if encoded is not None:
+                    self._remember(request_id, encoded)
+                    found[request_id] = (_codec.decode(encoded), 'redis')
+        return found
+
+    def put(self, request_id, entry):
+        """Record a completed request; safe to call from producer callback threads."""
+        encoded = _codec.encode(entry)
+        self._remember(request_id, encoded)
+        if self.redis_client is not None:
+            with self._lock:
+                self._pending[request_id] = encoded
+
+    def flush(self):
+        """Write the entries recorded since the last flush to Redis."""
+        if self.redis_client is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for request_id, encoded in pending.items():
+            pipeline.set(self.key_prefix + request_id, encoded, ex=self.ttl_seconds)
+        try:
+            pipeline.execute()
+        except Exception as e:
+            logger.warning("Could not write %d dedupe entries to Redis: %s", len(pending), e)
+
+    def _remember(self, request_id, encoded):
+        with self._lock:
+            self._entries[request_id] = encoded
+            self._entries.move_to_end(request_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
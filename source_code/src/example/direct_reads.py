@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mongoengine import connect, disconnect, get_db
+from pymongo.read_preferences import SecondaryPreferred
+
+from config import MONGO_URI
+from metrics import MONGO_LATENCY, observe_latency
+from models import CAR_PROJECTION, Car, to_item
+
+logger = logging.getLogger(__name__)
+
+# Direct reads let the API gateway resolve GET cache misses with one query
+# against a MongoDB secondary instead of a Kafka round trip through the data
+# processor; searches (GET /myapi with filters) are served from the same
+# pool. Writes always go through Kafka. Settings:
+#   DIRECT_READS_ENABLED                  cache misses read from MongoDB; off by default
+#   SEARCH_ENABLED                        serve searches; on by default
+#   DIRECT_READ_POOL_SIZE                 connections (and reader threads) in the pool
+#   DIRECT_READ_TIMEOUT_MS                server selection and socket timeout per query
+#   DIRECT_READ_MAX_STALENESS_SECONDS     skip secondaries lagging more than this (0 = any; Mongo minimum is 90)
+#   DIRECT_READ_CACHE_TTL_SECONDS         how long direct read results are cached (0 = not at all); a
+#                                         secondary may return a document a write just replaced, so
+#                                         this stays short rather than using CACHE_TTL_SECONDS
+DIRECT_READS_ENABLED = os.getenv('DIRECT_READS_ENABLED', 'false').lower() == 'true'
+SEARCH_ENABLED = os.getenv('SEARCH_ENABLED', 'true').lower() == 'true'
+DIRECT_READ_POOL_SIZE = int(os.getenv('DIRECT_READ_POOL_SIZE', '20'))
+DIRECT_READ_TIMEOUT_MS = int(os.getenv('DIRECT_READ_TIMEOUT_MS', '500'))
+DIRECT_READ_MAX_STALENESS_SECONDS = int(os.getenv('DIRECT_READ_MAX_STALENESS_SECONDS', '0'))
+DIRECT_READ_CACHE_TTL_SECONDS = int(os.getenv('DIRECT_READ_CACHE_TTL_SECONDS', '2'))
+
+DIRECT_READ_ALIAS = 'direct_reads'
+
+class DirectReader:
+    """Read-only, pooled MongoDB access preferring secondaries, for direct reads and search.
+
+    pymongo is blocking, so queries run on a dedicated thread pool sized to
+    the connection pool. Until connect() has succeeded `available` is False
+    and callers should fall back to the Kafka path.
+    """
+
+    def __init__(self, pool_size=DIRECT_READ_POOL_SIZE, timeout_ms=DIRECT_READ_TIMEOUT_MS,
+                 max_staleness=DIRECT_READ_MAX_STALENESS_SECONDS):
+        self.pool_size = pool_size
+        self.timeout_ms = timeout_ms
+        self.max_staleness = max_staleness
+        self._collection = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="mongo-read")
+
+    @property
+    def available(self):
+        return self._collection is not None
+
+    def connect(self):
+        """Open the pool and check a server answers; blocking and idempotent."""
+        with self._lock:
+            if self._collection is not None:
+                return
+            read_preference = SecondaryPreferred(max_staleness=self.max_staleness or -1)
+            disconnect(alias=DIRECT_READ_ALIAS)
+            connect(
+                alias=DIRECT_READ_ALIAS,
+                host=MONGO_URI,
+                read_preference=read_preference,
+                maxPoolSize=self.pool_size,
+                serverSelectionTimeoutMS=self.timeout_ms,
+                socketTimeoutMS=self.timeout_ms,
+                connectTimeoutMS=self.timeout_ms,
+            )
+            db = get_db(DIRECT_READ_ALIAS)
+            db.command('ping', read_preference=read_preference)
+            self._collection = db.get_collection(Car._get_collection_name(), read_preference=read_preference)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._collection = None
+            disconnect(alias=DIRECT_READ_ALIAS)
+
+    def _find_many(self, ids):
+        with observe_latency(MONGO_LATENCY, operation='direct_find'):
+            return [to_item(document) for document in self._collection.find({'_id': {'$in': ids}}, CAR_PROJECTION)]
+
+    async def find_many(self, ids):
+        """The items found among ids, in no particular order."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._find_many, list(ids))
+
+    def _next_batch(self, cursor, size):
+        with observe_latency(MONGO_LATENCY, operation='search_batch'):
+            return list(itertools.islice(cursor, size))
+
+    async def search(self, query, projection, sort, limit, batch_size):
+        """Yield the raw documents matching query in lists of at most batch_size.
+
+        Only one batch is held at a time, so memory stays bounded however many
+        documents match.
+        """
+        loop = asyncio.get_running_loop()
+        cursor = self._collection.find(query, projection, sort=sort, limit=limit, batch_size=batch_size)
+        try:
+            while True:
+                documents = await loop.run_in_executor(self._executor, self._next_batch, cursor, batch_size)
+                if not documents:
+                    return
+                yield documents
+        finally:
+            cursor.close()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from prometheus_client import make_wsgi_app
+from prometheus_client.exposition import ThreadingWSGIServer
+
+# Probe configuration shared by both services.
+#   HEALTH_CHECK_INTERVAL_SECONDS=5     probes reuse a dependency check younger than this
+#   HEALTH_CHECK_TIMEOUT_SECONDS=1      time allowed for a single dependency check
+#   DEPENDENCY_RETRY_SECONDS=2          wait between connection attempts during startup
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL_SECONDS', '5'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT_SECONDS', '1'))
+DEPENDENCY_RETRY = float(os.getenv('DEPENDENCY_RETRY_SECONDS', '2'))
+
+
+class DependencyStatus:
+    """Last known state of each dependency, updated by the service and read by its probes.
+
+    Probes report these cached results instead of opening connections of
+    their own; a service refreshes an entry when it is older than the check
+    interval, and its main loop beats the heartbeat used for liveness.
+    """
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._status = {name: (False, 'not connected', 0.0) for name in names}
+        self._heartbeat = time.monotonic()
+
+    def mark(self, name, ok, detail=None):
+        with self._lock:
+            self._status[name] = (ok, detail or ('ok' if ok else 'unavailable'), time.monotonic())
+
+    def is_fresh(self, name, max_age):
+        with self._lock:
+            return time.monotonic() - self._status[name][2] < max_age
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(ok for ok, _, _ in self._status.values())
+
+    def heartbeat(self):
+        self._heartbeat = time.monotonic()
+
+    def alive(self, max_age):
+        return time.monotonic() - self._heartbeat < max_age
+
+    def report(self):
+        with self._lock:
+            dependencies = {name: {'ok': ok, 'detail': detail} for name, (ok, detail, _) in self._status.items()}
+        ready = all(entry['ok'] for entry in dependencies.values())
+        return {'status': 'ready' if ready else 'unavailable', 'dependencies': dependencies}
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _json_response(start_response, status_code, body):
+    payload = json.dumps(body).encode('utf-8')
+    reason = 'OK' if status_code == 200 else 'Service Unavailable'
+    start_response(f'{status_code} {reason}', [('Content-Type', 'application/json'), ('Content-Length', str(len(payload)))])
+    return [payload]
+
+
+def start_probe_server(port, status, liveness_timeout):
+    """Serve /healthz, /readyz and the Prometheus metrics on port from a background thread.
+
+    /healthz fails only when the heartbeat is older than liveness_timeout
+    (a stuck main loop); /readyz fails while any dependency is down.
+    """
+    metrics_app = make_wsgi_app()
+
+    def app(environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/healthz':
+            alive = status.alive(liveness_timeout)
+            return _json_response(start_response, 200 if alive else 503, {'status': 'ok' if alive else 'stalled'})
+        if path == '/readyz':
+            report = status.report()
+            return _json_response(start_response, 200 if report['status'] == 'ready' else 503, report)
+        return metrics_app(environ, start_response)
+
+    server = make_server('', port, app, ThreadingWSGIServer, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name='probe-server', daemon=True).start()
+    return server
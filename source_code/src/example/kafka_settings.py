@@ -0,0 +1,107 @@
+import logging
+import os
+
+from kafka.admin import NewPartitions, NewTopic
+from kafka.errors import TopicAlreadyExistsError
+
+from config import KAFKA_REPLICATION_FACTOR, KAFKA_TOPIC_PARTITIONS
+
+logger = logging.getLogger(__name__)
+
+# Topics shared by the gateway and the data processor
+SHARED_TOPICS = ('data_requests', 'data_responses')
+
+# Producer tuning shared by both services (kafka-python setting names in brackets):
+#   KAFKA_PRODUCER_LINGER_MS      wait this long to fill a batch [linger_ms]
+#   KAFKA_PRODUCER_BATCH_SIZE     max bytes per partition batch [batch_size]
+#   KAFKA_PRODUCER_COMPRESSION    none, gzip, snappy, lz4 or zstd [compression_type]
+#   KAFKA_PRODUCER_ACKS           0, 1 or all [acks]
+#   KAFKA_PRODUCER_MAX_IN_FLIGHT  unacked requests per connection [max_in_flight_requests_per_connection]
+#   KAFKA_PRODUCER_IDEMPOTENCE    true to enable the idempotent producer (forces acks=all) [enable_idempotence]
+
+
+def _acks(value):
+    return value if value == 'all' else int(value)
+
+
+# kafka.codec check and the package it needs, per compression type
+COMPRESSION_SUPPORT = {
+    'gzip': ('has_gzip', 'gzip'),
+    'snappy': ('has_snappy', 'python-snappy'),
+    'lz4': ('has_lz4', 'lz4'),
+    'zstd': ('has_zstd', 'zstandard'),
+}
+
+
+def _compression(value):
+    """Validate the compression type once at import, rather than failing every producer build."""
+    value = value.lower()
+    if value == 'none':
+        return value
+    if value not in COMPRESSION_SUPPORT:
+        raise ValueError(f"KAFKA_PRODUCER_COMPRESSION={value!r}; expected none, {', '.join(COMPRESSION_SUPPORT)}")
+    from kafka import codec
+    check, package = COMPRESSION_SUPPORT[value]
+    if not getattr(codec, check)():
+        raise ValueError(f"KAFKA_PRODUCER_COMPRESSION={value!r} needs the {package} package, which is not installed")
+    return value
+
+
+PRODUCER_COMPRESSION = _compression(os.getenv('KAFKA_PRODUCER_COMPRESSION', 'none'))
+
+
+def producer_config():
+    """Keyword arguments for KafkaProducer built from the environment."""
+    config = {
+        'linger_ms': int(os.getenv('KAFKA_PRODUCER_LINGER_MS', '5')),
+        'batch_size': int(os.getenv('KAFKA_PRODUCER_BATCH_SIZE', '16384')),
+        'acks': _acks(os.getenv('KAFKA_PRODUCER_ACKS', '1')),
+        'max_in_flight_requests_per_connection': int(os.getenv('KAFKA_PRODUCER_MAX_IN_FLIGHT', '5')),
+    }
+    if PRODUCER_COMPRESSION != 'none':
+        config['compression_type'] = PRODUCER_COMPRESSION
+    if os.getenv('KAFKA_PRODUCER_IDEMPOTENCE', 'false').lower() == 'true':
+        config['enable_idempotence'] = True
+        config['acks'] = 'all'
+        config['max_in_flight_requests_per_connection'] = min(config['max_in_flight_requests_per_connection'], 5)
+    return config
+
+
+def ensure_kafka_topics(admin_client):
+    """Create the shared topics, or grow them to KAFKA_TOPIC_PARTITIONS; returns the topics that existed before."""
+    existing_topics = admin_client.list_topics()
+    for topic in SHARED_TOPICS:
+        if topic not in existing_topics:
+            try:
+                admin_client.create_topics([NewTopic(name=topic, num_partitions=KAFKA_TOPIC_PARTITIONS, replication_factor=KAFKA_REPLICATION_FACTOR)])
+                logger.info("Created Kafka topic: %s with %d partitions", topic, KAFKA_TOPIC_PARTITIONS)
+            except TopicAlreadyExistsError:
+                logger.info("Kafka topic %s already exists", topic)
+    # Grow existing topics; partitions can only be added, never removed
+    grown_topics = [topic for topic in SHARED_TOPICS if topic in existing_topics]
+    for description in admin_client.describe_topics(grown_topics) if grown_topics else []:
+        current = len(description['partitions'])
+        if current < KAFKA_TOPIC_PARTITIONS:
+            admin_client.create_partitions({description['topic']: NewPartitions(total_count=KAFKA_TOPIC_PARTITIONS)})
+            logger.info("Grew Kafka topic %s from %d to %d partitions", description['topic'], current, KAFKA_TOPIC_PARTITIONS)
+    return existing_topics
+
+
+# Producer metrics worth watching, as reported by KafkaProducer.metrics()['producer-metrics']
+PRODUCER_METRIC_NAMES = (
+    'record-send-rate',
+    'record-error-rate',
+    'record-retry-rate',
+    'batch-size-avg',
+    'records-per-request-avg',
+    'record-queue-time-avg',
+    'record-queue-time-max',
+    'request-latency-avg',
+    'compression-rate-avg',
+    'bufferpool-wait-ratio',
+)
+
+
+def producer_metrics_summary(producer):
+    metrics = producer.metrics().get('producer-metrics', {})
+    return {name: metrics.get(name) for name in PRODUCER_METRIC_NAMES}
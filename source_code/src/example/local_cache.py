@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import L1_CACHE_EVICTIONS
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with a per-entry TTL.
+
+    Values are stored as-is (already deserialized), so a hit costs a dict
+    lookup. A max_items of 0 disables the cache. Hits and misses are counted
+    by the callers (cache_lookups_total); evictions are exported here.
+    """
+
+    def __init__(self, max_items=10000, ttl_seconds=5.0):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_items > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds=None):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                L1_CACHE_EVICTIONS.inc()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from opentelemetry import trace
+
+# Logging configuration shared by both services.
+#   LOG_FORMAT=text|json            plain text (default) or one JSON object per line
+#   LOG_LEVEL=INFO                  root log level; payload dumps are logged at DEBUG
+#   LOG_RATE_LIMIT_PER_SECOND=0     per-logger token bucket for INFO and below (0 = off)
+#   LOG_QUEUE_SIZE=10000            records buffered for the background writer
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_RATE_LIMIT_PER_SECOND = float(os.getenv('LOG_RATE_LIMIT_PER_SECOND', '0'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+TEXT_FORMAT = '%(asctime)s %(name)s %(levelname)s [Trace ID: %(trace_id)s] [Span ID: %(span_id)s] %(message)s'
+
+_listener = None
+
+
+class TraceContextFilter(logging.Filter):
+    """Attach the current OpenTelemetry trace and span ids to each record."""
+
+    def filter(self, record):
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, '032x')
+            record.span_id = format(span_context.span_id, '016x')
+        else:
+            record.trace_id = getattr(record, 'trace_id', 'N/A')
+            record.span_id = getattr(record, 'span_id', 'N/A')
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger name; WARNING and above always pass."""
+
+    def __init__(self, rate_per_second, burst=None):
+        super().__init__()
+        self.rate = rate_per_second
+        self.burst = burst if burst is not None else max(1.0, rate_per_second)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(record.name, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[record.name] = (tokens, now)
+                self.dropped += 1
+                return False
+            self._buckets[record.name] = (tokens - 1, now)
+            return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'trace_id': getattr(record, 'trace_id', 'N/A'),
+            'span_id': getattr(record, 'span_id', 'N/A'),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _ContextQueueHandler(QueueHandler):
+    """QueueHandler that keeps the record's args unformatted.
+
+    The stock handler formats the message on the caller's thread; here
+    formatting is left to the background listener, so the caller only pays
+    for the trace-context lookup and the enqueue.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        # Never block the caller: drop the record when the writer falls behind
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    """Install the shared handlers on the root logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    record_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _ContextQueueHandler(record_queue)
+    # Filters run on the caller's thread, where the OpenTelemetry context is current.
+    # The rate limit goes first so dropped records skip the context lookup.
+    if LOG_RATE_LIMIT_PER_SECOND > 0:
+        queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT_PER_SECOND))
+    queue_handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(record_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    # Suppress verbose Kafka logs
+    logging.getLogger('kafka').setLevel(logging.WARNING)
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
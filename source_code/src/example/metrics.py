@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+
+from opentelemetry import trace
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE
+from prometheus_client.openmetrics.exposition import generate_latest as generate_openmetrics
+
+# Latency buckets in seconds, from sub-millisecond cache hits up to reply timeouts
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+# API gateway
+REDIS_LATENCY = Histogram(
+    'redis_operation_seconds', 'Latency of Redis cache operations', ['operation'], buckets=LATENCY_BUCKETS)
+KAFKA_PRODUCE_ACK_LATENCY = Histogram(
+    'kafka_produce_ack_seconds', 'Time from send() to broker ack for produced records', ['topic'], buckets=LATENCY_BUCKETS)
+KAFKA_REPLY_WAIT = Histogram(
+    'kafka_reply_wait_seconds', 'Time a request waited for its reply from the data processor', ['outcome'], buckets=LATENCY_BUCKETS)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total', 'Cache lookups by layer and result', ['layer', 'result'])
+HTTP_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being served')
+REPLIES_PENDING = Gauge(
+    'kafka_replies_pending', 'Requests waiting for a reply from the data processor')
+L1_CACHE_ENTRIES = Gauge(
+    'l1_cache_entries', 'Entries in the in-process L1 cache')
+L1_CACHE_EVICTIONS = Counter(
+    'l1_cache_evictions_total', 'Entries evicted from the in-process L1 cache to stay within its size')
+REQUEST_QUEUE_WAIT = Histogram(
+    'http_request_queue_wait_seconds', 'Time API requests waited for a concurrency slot', buckets=LATENCY_BUCKETS)
+REQUESTS_QUEUED = Gauge(
+    'http_requests_queued', 'API requests waiting for a concurrency slot')
+REQUESTS_SHED = Counter(
+    'http_requests_shed_total', 'API requests refused with 503 to shed load', ['reason'])
+CIRCUIT_STATE = Gauge(
+    'circuit_breaker_state', 'Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)', ['dependency'])
+REDIS_POOL_CONNECTIONS = Gauge(
+    'redis_pool_connections', 'Redis connections held by the gateway, by state', ['state'])
+REDIS_POOL_MAX_CONNECTIONS = Gauge(
+    'redis_pool_max_connections', 'Upper bound on Redis connections across the gateway pools')
+
+# Data processor
+MONGO_LATENCY = Histogram(
+    'mongo_operation_seconds', 'Latency of grouped MongoDB operations', ['operation'], buckets=LATENCY_BUCKETS)
+BATCH_SIZE = Histogram(
+    'processor_batch_size', 'Records per processed batch', buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+MESSAGES_PROCESSED = Counter(
+    'processor_messages_total', 'Processed request messages by type', ['type'])
+MESSAGES_EXPIRED = Counter(
+    'processor_messages_expired_total', 'Request messages dropped because their deadline had passed', ['type'])
+CONSUMER_LAG = Gauge(
+    'kafka_consumer_lag', 'Records not yet consumed, per assigned partition', ['topic', 'partition'])
+RECORDS_COMMITTED = Counter(
+    'processor_records_committed_total', 'Records processed and committed, per partition', ['topic', 'partition'])
+REQUESTS_DEDUPLICATED = Counter(
+    'processor_requests_deduplicated_total', 'Redelivered requests answered from the dedupe store, by where they were found',
+    ['tier'])
+DEDUPE_ENTRIES = Gauge(
+    'processor_dedupe_entries', 'Completed request ids held in the in-process dedupe store')
+PROCESSING_RATE = Gauge(
+    'processor_records_per_second', 'Records committed per second since the previous lag update, per assigned partition',
+    ['topic', 'partition'])
+
+# Cache sync
+CACHE_SYNC_EVENTS = Counter(
+    'cache_sync_events_total', 'MongoDB change events applied to the Redis cache, by action', ['action'])
+CACHE_SYNC_LAG = Gauge(
+    'cache_sync_lag_seconds', 'Age of the last applied change event when it was applied')
+CACHE_WARMED = Counter(
+    'cache_warmed_items_total', 'Items written to Redis by cache warming')
+
+
+def trace_exemplar():
+    """Exemplar labels linking an observation to the current sampled trace, if any."""
+    span_context = trace.get_current_span().get_span_context()
+    if span_context.is_valid and span_context.trace_flags.sampled:
+        return {'trace_id': format(span_context.trace_id, '032x')}
+    return None
+
+
+@contextmanager
+def observe_latency(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.perf_counter() - start, exemplar=trace_exemplar())
+
+
+def render_metrics(accept_header):
+    """Return (body, content type); OpenMetrics (with exemplars) when the scraper asks for it."""
+    if accept_header and 'application/openmetrics-text' in accept_header:
+        return generate_openmetrics(), OPENMETRICS_CONTENT_TYPE
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,10 +1,23 @@
-import os
-from mongoengine import Document, StringField, IntField, connect
+from mongoengine import Document, StringField, IntField
 
-connect(host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mydatabase'))
+# The connection is made by data_processor.connect_mongo() (config.MONGO_URI),
+# which also creates the indexes declared in meta
 
 class Car(Document):
-    meta = {'collection': 'car_collection'}
+    meta = {
+        'collection': 'car_collection',
+        # Searches (see search.py): an optional year equality, then the sort
+        # field with the id as tie-breaker, which is also the keyset cursor
+        'indexes': [
+            ('year', 'id'),
+            ('year', 'price', 'id'),
+            ('year', 'name', 'id'),
+            ('price', 'id'),
+            ('name', 'id'),
+        ],
+        # Created explicitly by data_processor.connect_mongo(), never as a side effect of a query
+        'auto_create_index': False,
+    }
     id = IntField(primary_key=True)
     name = StringField(max_length=100)
     price = IntField()
@@ -15,3 +28,12 @@ class Car(Document):
         data = self.to_mongo().to_dict()
         data['id'] = data.pop('_id')
         return data
+
+
+# Stored fields of a Car, for raw pymongo reads that bypass the model
+CAR_PROJECTION = {field.db_field: 1 for field in Car._fields.values()}
+
+def to_item(document):
+    """Rename `_id` to `id` in a raw car document, in place."""
+    document['id'] = document.pop('_id')
+    return document
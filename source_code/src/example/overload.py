@@ -0,0 +1,134 @@
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """A request was refused to protect the service; retry_after is a hint in seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline ran out before a dependency could answer; not the dependency's fault."""
+
+
+class ConcurrencyLimiter:
+    """Serve at most max_concurrent requests at once and queue a bounded number more.
+
+    A queued request waits at most max_wait seconds, or until its deadline if
+    that comes first; requests beyond max_queue are refused straight away.
+    A max_concurrent of 0 disables the limiter.
+    """
+
+    def __init__(self, max_concurrent, max_queue, max_wait):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        # Created on first use so it belongs to the serving event loop
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def slot(self, deadline=None):
+        """Hold a slot for the duration of the block; deadline is a time.monotonic() value."""
+        await self.acquire(deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, deadline=None):
+        """Take a slot, queueing if needed; every successful call must be paired with release()."""
+        if self.max_concurrent <= 0:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise Overloaded('queue_full', self.max_wait)
+            wait = self.max_wait if deadline is None else min(self.max_wait, deadline - time.monotonic())
+            if wait <= 0:
+                raise Overloaded('deadline', self.max_wait)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=wait)
+            except asyncio.TimeoutError:
+                raise Overloaded('queue_timeout', self.max_wait)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+
+    def release(self):
+        if self.max_concurrent <= 0:
+            return
+        self.active -= 1
+        self._semaphore.release()
+
+
+class CircuitBreaker:
+    """Stop calling a dependency after failure_threshold consecutive failures.
+
+    While open, allow() is False for reset_timeout seconds; then one trial
+    call is let through (half-open) and its outcome closes or re-opens the
+    circuit. Outcomes may be recorded from any thread.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=10.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # Also re-arms a half-open circuit whose trial never reported back
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def check(self):
+        """Raise Overloaded when the circuit does not allow a call."""
+        if not self.allow():
+            raise Overloaded(f'{self.name}_unavailable', self.retry_after)
+
+    @property
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
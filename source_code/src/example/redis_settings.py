@@ -0,0 +1,148 @@
+import os
+
+import redis
+import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+# Redis connection settings, shared by every service that uses Redis:
+#   REDIS_MODE                           standalone (default), sentinel or cluster
+#   REDIS_HOST, REDIS_PORT, REDIS_DB     server (standalone) or any startup node (cluster)
+#   REDIS_SENTINELS                      host:port[,host:port...] (sentinel mode)
+#   REDIS_SENTINEL_MASTER                monitored master name (sentinel mode)
+#   REDIS_READ_FROM_REPLICAS             serve cache reads from replicas (sentinel/cluster)
+#   REDIS_MAX_CONNECTIONS                connections per pool
+#   REDIS_POOL_BLOCKING                  wait for a free connection instead of failing (standalone)
+#   REDIS_POOL_TIMEOUT_SECONDS           how long to wait for a free connection
+#   REDIS_SOCKET_TIMEOUT_SECONDS         per-command read/write timeout
+#   REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS connect timeout
+#   REDIS_HEALTH_CHECK_INTERVAL_SECONDS  PING idle connections before reuse (0 = off)
+#   REDIS_RETRIES                        retries on connection errors and timeouts
+REDIS_MODE = os.getenv('REDIS_MODE', 'standalone').lower()
+REDIS_READ_FROM_REPLICAS = os.getenv('REDIS_READ_FROM_REPLICAS', 'false').lower() == 'true'
+
+
+def _connection_kwargs(retry_class=AsyncRetry):
+    return {
+        'password': os.getenv('REDIS_PASSWORD') or None,
+        'socket_timeout': float(os.getenv('REDIS_SOCKET_TIMEOUT_SECONDS', '1')),
+        'socket_connect_timeout': float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS', '1')),
+        'health_check_interval': int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL_SECONDS', '30')),
+        'retry': retry_class(ExponentialBackoff(cap=0.5, base=0.01), int(os.getenv('REDIS_RETRIES', '2'))),
+    }
+
+
+def _max_connections():
+    return int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+
+
+def _host_port():
+    return os.getenv('REDIS_HOST', 'localhost'), int(os.getenv('REDIS_PORT', '6379'))
+
+
+def _standalone_pool():
+    host, port = _host_port()
+    kwargs = dict(_connection_kwargs(), host=host, port=port, db=int(os.getenv('REDIS_DB', '0')),
+                  max_connections=_max_connections())
+    if os.getenv('REDIS_POOL_BLOCKING', 'true').lower() == 'true':
+        return aioredis.BlockingConnectionPool(timeout=float(os.getenv('REDIS_POOL_TIMEOUT_SECONDS', '1')), **kwargs)
+    return aioredis.ConnectionPool(**kwargs)
+
+
+def build_redis_clients():
+    """Return (client, reader, subscriber) for the configured mode.
+
+    client serves writes, locks and publishing; reader serves cache reads and
+    is a replica-backed client when REDIS_READ_FROM_REPLICAS is set;
+    subscriber is a single-node client for pub/sub.
+    """
+    if REDIS_MODE == 'sentinel':
+        from redis.asyncio.sentinel import Sentinel
+        connection_kwargs = _connection_kwargs()
+        sentinel = Sentinel(_sentinels(), socket_timeout=connection_kwargs['socket_timeout'],
+                            sentinel_kwargs={'password': connection_kwargs['password']})
+        master_name = os.getenv('REDIS_SENTINEL_MASTER', 'mymaster')
+        db = int(os.getenv('REDIS_DB', '0'))
+        client = sentinel.master_for(master_name, db=db, max_connections=_max_connections(), **connection_kwargs)
+        reader = client
+        if REDIS_READ_FROM_REPLICAS:
+            reader = sentinel.slave_for(master_name, db=db, max_connections=_max_connections(), **connection_kwargs)
+        return client, reader, client
+
+    if REDIS_MODE == 'cluster':
+        from redis.asyncio.cluster import RedisCluster
+        host, port = _host_port()
+        connection_kwargs = _connection_kwargs()
+        client = RedisCluster(host=host, port=port, read_from_replicas=REDIS_READ_FROM_REPLICAS,
+                              max_connections=_max_connections(), **connection_kwargs)
+        # Cluster clients have no pub/sub; PUBLISH is propagated cluster-wide, so
+        # subscribing on the startup node sees every invalidation
+        subscriber = aioredis.Redis(host=host, port=port, **connection_kwargs)
+        return client, client, subscriber
+
+    client = aioredis.Redis(connection_pool=_standalone_pool())
+    return client, client, client
+
+
+def _sentinels():
+    return [(host, int(port)) for host, port in
+            (address.rsplit(':', 1) for address in (os.getenv('REDIS_SENTINELS') or 'localhost:26379').split(','))]
+
+
+def build_sync_redis_client():
+    """A blocking client on the primary for the configured mode, for services without an event loop."""
+    connection_kwargs = _connection_kwargs(Retry)
+    db = int(os.getenv('REDIS_DB', '0'))
+    if REDIS_MODE == 'sentinel':
+        from redis.sentinel import Sentinel
+        sentinel = Sentinel(_sentinels(), socket_timeout=connection_kwargs['socket_timeout'],
+                            sentinel_kwargs={'password': connection_kwargs['password']})
+        return sentinel.master_for(os.getenv('REDIS_SENTINEL_MASTER', 'mymaster'), db=db,
+                                   max_connections=_max_connections(), **connection_kwargs)
+    host, port = _host_port()
+    if REDIS_MODE == 'cluster':
+        from redis.cluster import RedisCluster
+        return RedisCluster(host=host, port=port, max_connections=_max_connections(), **connection_kwargs)
+    return redis.Redis(host=host, port=port, db=db, max_connections=_max_connections(), **connection_kwargs)
+
+
+def connection_pools(client):
+    """The connection pools behind a client (one per node for a cluster)."""
+    if hasattr(client, 'connection_pool'):
+        return [client.connection_pool]
+    return list(client.get_nodes()) if hasattr(client, 'get_nodes') else []
+
+
+def _pool_counts(pool):
+    # redis-py has no public pool statistics, so read the internal bookkeeping
+    if hasattr(pool, '_in_use_connections'):
+        return len(pool._in_use_connections), len(pool._available_connections), pool.max_connections
+    if hasattr(pool, '_free'):
+        # A cluster node's own pool
+        return len(pool._connections) - len(pool._free), len(pool._free), pool.max_connections
+    return 0, 0, 0
+
+
+def pool_usage(*clients):
+    """(in use, idle, max) connections summed over the distinct pools of clients."""
+    totals = [0, 0, 0]
+    seen = set()
+    for client in clients:
+        for pool in connection_pools(client):
+            if id(pool) not in seen:
+                seen.add(id(pool))
+                totals = [total + count for total, count in zip(totals, _pool_counts(pool))]
+    return tuple(totals)
+
+
+async def close_redis_clients(*clients):
+    closed = set()
+    for client in clients:
+        if id(client) in closed:
+            continue
+        closed.add(id(client))
+        if hasattr(client, 'connection_pool'):
+            await client.connection_pool.disconnect()
+        else:
+            await client.close()
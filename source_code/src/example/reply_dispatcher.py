@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+from kafka import KafkaConsumer, TopicPartition
+from opentelemetry import trace
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+from codec import decode_kafka_value
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+propagator = TraceContextTextMapPropagator()
+
+
+class ReplyDispatcher:
+    """Single long-lived consumer that routes replies to waiting requests.
+
+    Callers register a correlation id before producing their request and
+    wait on the returned Future; the background thread completes it when a
+    reply carrying the same correlation id arrives.
+
+    The consumer is manually assigned to this instance's reply address (a
+    private topic, or a dedicated partition of a shared topic), so there is
+    no consumer group and no rebalance on startup.
+    """
+
+    def __init__(self, topic, bootstrap_servers, partitions=None, poll_timeout_ms=100):
+        self.topic = topic
+        self.bootstrap_servers = bootstrap_servers
+        self.partitions = partitions
+        self.poll_timeout_ms = poll_timeout_ms
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # A thread that could not build its consumer has exited and may be restarted
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="reply-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.cancel()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        """True while the consumer thread is running and assigned to the reply address."""
+        return self._ready.is_set() and self._thread is not None and self._thread.is_alive()
+
+    def register(self, correlation_id):
+        future = Future()
+        with self._lock:
+            self._pending[correlation_id] = future
+        return future
+
+    def fail(self, correlation_id, exc):
+        """Complete a pending request with an error, e.g. when its request was not delivered."""
+        with self._lock:
+            future = self._pending.get(correlation_id)
+        if future is not None:
+            try:
+                future.set_exception(exc)
+            except InvalidStateError:
+                pass
+
+    def discard(self, correlation_id):
+        with self._lock:
+            self._pending.pop(correlation_id, None)
+
+    async def wait_async(self, correlation_id, timeout):
+        """Await a reply from the event loop without blocking it."""
+        with self._lock:
+            future = self._pending.get(correlation_id)
+        if future is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError as e:
+            logger.error("No reply for correlation ID %s within %ss: %r", correlation_id, timeout, e)
+            return None
+        finally:
+            self.discard(correlation_id)
+
+    @property
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _build_consumer(self):
+        consumer = KafkaConsumer(
+            bootstrap_servers=self.bootstrap_servers,
+            auto_offset_reset='latest',
+            enable_auto_commit=False,
+            group_id=None,
+        )
+        partitions = self.partitions
+        if partitions is None:
+            partitions = consumer.partitions_for_topic(self.topic) or {0}
+        assignment = [TopicPartition(self.topic, partition) for partition in sorted(partitions)]
+        consumer.assign(assignment)
+        consumer.seek_to_end(*assignment)
+        # Resolve the end offsets now so replies produced after readiness are never skipped
+        for tp in assignment:
+            consumer.position(tp)
+        return consumer
+
+    def _run(self):
+        try:
+            consumer = self._build_consumer()
+        except Exception as e:
+            logger.error("Reply dispatcher could not start: %s", e, exc_info=True)
+            return
+        self._ready.set()
+        logger.info("Reply dispatcher consuming %s", consumer.assignment())
+        try:
+            while not self._stopped.is_set():
+                records = consumer.poll(timeout_ms=self.poll_timeout_ms)
+                for messages in records.values():
+                    for msg in messages:
+                        self._dispatch(msg)
+        except Exception as e:
+            logger.error("Reply dispatcher stopped unexpectedly: %s", e, exc_info=True)
+        finally:
+            consumer.close()
+
+    def _dispatch(self, msg):
+        try:
+            value = decode_kafka_value(msg.value, msg.headers)
+        except Exception as e:
+            logger.warning("Dropping undecodable reply at offset %s: %s", msg.offset, e)
+            return
+        correlation_id = value.get('correlation_id') if isinstance(value, dict) else None
+        if correlation_id is None:
+            return
+        with self._lock:
+            future = self._pending.get(correlation_id)
+        if future is None or future.done():
+            return
+
+        traceparent_header = next((header[1].decode('utf-8') for header in msg.headers or [] if header[0] == 'traceparent'), None)
+        headers = {'traceparent': traceparent_header} if traceparent_header else {}
+        extracted_context = propagator.extract(carrier=headers)
+
+        with tracer.start_as_current_span("process_kafka_message", context=extracted_context) as span:
+            span.set_attribute("messaging.correlation_id", correlation_id)
+            try:
+                future.set_result(value)
+            except InvalidStateError:
+                # The waiter already timed out or the dispatcher is stopping
+                pass
@@ -0,0 +1,78 @@
+import base64
+import json
+import re
+
+from models import CAR_PROJECTION
+
+# Search over cars for GET /myapi: equality on year, a price range and a name
+# prefix, ordered by id, price or name with the id breaking ties. Pages are
+# keyset-paginated: the cursor holds the sort value and id of the last item
+# returned, so each page is one index range scan however deep it is. The
+# compound indexes in Car.meta match these filter and sort combinations.
+SORT_FIELDS = {'id': '_id', 'price': 'price', 'name': 'name'}
+FIELDS = {'id' if field == '_id' else field for field in CAR_PROJECTION}
+
+
+class SearchError(ValueError):
+    """The search parameters are invalid."""
+
+
+def encode_cursor(sort, document):
+    """Cursor pointing just past document (a raw document as returned by the search)."""
+    position = [sort, document.get(SORT_FIELDS[sort]), document['_id']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise SearchError("Invalid cursor")
+    if cursor_sort != sort:
+        raise SearchError("The cursor belongs to a search with another sort order")
+    return value, last_id
+
+
+def parse_fields(fields):
+    """Projection for a comma-separated field list (all fields when empty); id is always included."""
+    if not fields:
+        return dict(CAR_PROJECTION)
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested - FIELDS
+    if unknown:
+        raise SearchError(f"Unknown fields: {', '.join(sorted(unknown))}; expected some of {', '.join(sorted(FIELDS))}")
+    return {'_id': 1, **{field: 1 for field in requested if field != 'id'}}
+
+
+def build_query(year=None, min_price=None, max_price=None, name_prefix=None, sort='id', cursor=None):
+    """Return the MongoDB filter and sort specification for a search page."""
+    if sort not in SORT_FIELDS:
+        raise SearchError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise SearchError("min_price is greater than max_price")
+
+    conditions = []
+    if year is not None:
+        conditions.append({'year': year})
+    price = {}
+    if min_price is not None:
+        price['$gte'] = min_price
+    if max_price is not None:
+        price['$lte'] = max_price
+    if price:
+        conditions.append({'price': price})
+    if name_prefix:
+        # An anchored, case-sensitive prefix can use the name index
+        conditions.append({'name': {'$regex': f'^{re.escape(name_prefix)}'}})
+
+    sort_field = SORT_FIELDS[sort]
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        if sort_field == '_id':
+            conditions.append({'_id': {'$gt': last_id}})
+        else:
+            conditions.append({'$or': [{sort_field: {'$gt': value}}, {sort_field: value, '_id': {'$gt': last_id}}]})
+
+    query = conditions[0] if len(conditions) == 1 else ({'$and': conditions} if conditions else {})
+    sort_spec = [(sort_field, 1)] + ([('_id', 1)] if sort_field != '_id' else [])
+    return query, sort_spec
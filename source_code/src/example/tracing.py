@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+# Sampling configuration shared by both services.
+#   TRACING_SAMPLING_MODE=head: parent-based ratio sampling at span start (cheapest)
+#   TRACING_SAMPLING_MODE=tail: record everything, but only export traces that are
+#   in the ratio, contain an error, or whose local root ran for at least
+#   TRACING_SLOW_THRESHOLD_MS.
+# Batch export limits use the standard OTEL_BSP_* variables (max queue size,
+# max export batch size, schedule delay, export timeout) read by the SDK.
+SAMPLING_MODE = os.getenv('TRACING_SAMPLING_MODE', 'head').lower()
+SAMPLE_RATIO = float(os.getenv('OTEL_TRACES_SAMPLER_ARG', '1.0'))
+SLOW_THRESHOLD_MS = float(os.getenv('TRACING_SLOW_THRESHOLD_MS', '500'))
+TAIL_MAX_BUFFERED_TRACES = int(os.getenv('TRACING_TAIL_MAX_BUFFERED_TRACES', '2048'))
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """Buffer spans per trace and forward them only if the trace is worth keeping.
+
+    The decision is taken when the local root span (no parent, or a remote
+    parent) ends. Spans ending after the decision follow it. The buffer is
+    bounded: the oldest undecided traces are dropped first.
+    """
+
+    def __init__(self, delegate, ratio, slow_threshold_ms, max_buffered_traces):
+        self._delegate = delegate
+        self._ratio_sampler = TraceIdRatioBased(ratio)
+        self._slow_threshold_ns = int(slow_threshold_ms * 1_000_000)
+        self._max_buffered_traces = max_buffered_traces
+        self._buffers = OrderedDict()
+        self._decisions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context=None):
+        self._delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is None:
+                buffered = self._buffers.setdefault(trace_id, [])
+                buffered.append(span)
+                if not is_local_root:
+                    while len(self._buffers) > self._max_buffered_traces:
+                        self._buffers.popitem(last=False)
+                    return
+                spans = self._buffers.pop(trace_id)
+                decision = self._keep(span, spans)
+                self._decisions[trace_id] = decision
+                while len(self._decisions) > self._max_buffered_traces:
+                    self._decisions.popitem(last=False)
+            else:
+                spans = [span]
+        if decision:
+            for buffered_span in spans:
+                self._delegate.on_end(buffered_span)
+
+    def _keep(self, root, spans):
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            return True
+        if root.end_time - root.start_time >= self._slow_threshold_ns:
+            return True
+        # Same trace-id based test as TraceIdRatioBased, so services agree on ratio-kept traces
+        return (root.context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT) < self._ratio_sampler.bound
+
+    def shutdown(self):
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._delegate.force_flush(timeout_millis)
+
+
+def build_tracer_provider(service_name, otlp_endpoint):
+    """Create a TracerProvider with the configured sampler and bounded batch export."""
+    resource = Resource.create({"service.name": service_name})
+    exporter_processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint, insecure=True))
+    if SAMPLING_MODE == 'tail':
+        provider = TracerProvider(resource=resource, sampler=ParentBased(ALWAYS_ON))
+        provider.add_span_processor(TailSamplingSpanProcessor(
+            exporter_processor, SAMPLE_RATIO, SLOW_THRESHOLD_MS, TAIL_MAX_BUFFERED_TRACES
+        ))
+    else:
+        provider = TracerProvider(resource=resource, sampler=ParentBased(TraceIdRatioBased(SAMPLE_RATIO)))
+        provider.add_span_processor(exporter_processor)
+    return provider
@@ -7,7 +7,10 @@ if [ "$SERVICE" = "api_gateway" ]; then
 elif [ "$SERVICE" = "data_processor" ]; then
     # Start the Data Processor service
     python /app/data_processor.py
+elif [ "$SERVICE" = "cache_sync" ]; then
+    # Start the change-stream cache maintenance service
+    python /app/cache_sync.py
 else
-    echo "Invalid service specified. Set the SERVICE environment variable to 'api_gateway' or 'data_processor'."
+    echo "Invalid service specified. Set the SERVICE environment variable to 'api_gateway', 'data_processor' or 'cache_sync'."
     exit 1
 fi